@@ -0,0 +1,131 @@
+"""Skips fontmake builds whose inputs haven't changed since the last build.
+
+A build's inputs are the designspace file, every file in each source UFO
+(glifs, fontinfo, features, kerning and so on), the fontmake arguments and
+the versions of the build tools. If none of those have changed and the fonts
+the last build wrote are all still there, the build can be skipped."""
+
+import os
+import shutil
+import tempfile
+import time
+from importlib.metadata import version
+
+import fontTools
+import fontmake
+from fontTools.designspaceLib import DesignSpaceDocument
+
+from Cache import FileHasher, cache_dir, key_for, read_json, write_json
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".woff", ".woff2")
+
+# Staging directories left behind by builds which were killed are removed
+# once they are this old (in seconds)
+STALE_STAGING = 24 * 60 * 60
+
+
+def prune_staging():
+    staging = cache_dir("staging")
+    for name in os.listdir(staging):
+        path = os.path.join(staging, name)
+        try:
+            if time.time() - os.path.getmtime(path) > STALE_STAGING:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class BuildCache:
+    def __init__(self, designspace_file, fontmake_args):
+        self.designspace_file = os.path.abspath(designspace_file)
+        self.fontmake_args = fontmake_args
+        # Without an explicit output directory, fontmake writes relative to
+        # the working directory
+        explicit = fontmake_args.get("output_dir") or fontmake_args.get("output_path")
+        self.cwd = None if explicit else os.getcwd()
+        self.path = os.path.join(
+            cache_dir("builds"),
+            key_for(self.designspace_file, self.cwd, fontmake_args) + ".json",
+        )
+        self.staging = None
+        self.inputs = None
+
+    def inputs_key(self):
+        designspace = DesignSpaceDocument.fromfile(self.designspace_file)
+        sources = []
+        for source in designspace.sources:
+            hasher = FileHasher(source.path)
+            sources.append([source.path, hasher.tree_digest(source.path)])
+            hasher.save()
+        hasher = FileHasher(self.designspace_file)
+        designspace_digest = hasher.digest(self.designspace_file)
+        hasher.save()
+        return key_for(
+            designspace_digest,
+            sources,
+            self.fontmake_args,
+            # (ufo2ft's version without importing it, which is slow)
+            [fontTools.version, fontmake.__version__, version("ufo2ft")],
+        )
+
+    def output_dir(self, filename):
+        """Where fontmake would have put this output had we not staged it."""
+        if self.fontmake_args.get("output_path"):
+            return os.path.dirname(self.fontmake_args["output_path"])
+        if self.fontmake_args.get("output_dir"):
+            return self.fontmake_args["output_dir"]
+        return os.path.join(self.cwd, "instance_%s" % filename.rsplit(".", 1)[-1])
+
+    def up_to_date(self):
+        entry = read_json(self.path)
+        if not entry or not entry["outputs"]:
+            return False
+        # Outputs are only checked for existence: masters built as instances
+        # can legitimately overwrite a named instance of the same name.
+        if not all(os.path.exists(x) for x in entry["outputs"]):
+            return False
+        self.inputs = self.inputs_key()
+        return entry["inputs"] == self.inputs
+
+    def begin(self):
+        """Returns the fontmake arguments to build with. The build writes into
+        a private staging directory, so that we know exactly which fonts it
+        made even when other builds are writing to the same place."""
+        if self.inputs is None:
+            self.inputs = self.inputs_key()
+        prune_staging()
+        self.staging = tempfile.mkdtemp(prefix="build-", dir=cache_dir("staging"))
+        args = dict(self.fontmake_args)
+        if args.get("output_path"):
+            args["output_path"] = os.path.join(
+                self.staging, os.path.basename(args["output_path"])
+            )
+        else:
+            args["output_dir"] = self.staging
+        return args
+
+    def commit(self):
+        """Moves the staged fonts into place and records them as this
+        build's outputs."""
+        outputs = []
+        for root, dirs, files in os.walk(self.staging):
+            for name in files:
+                if not name.endswith(FONT_EXTENSIONS):
+                    continue
+                directory = self.output_dir(name)
+                os.makedirs(directory, exist_ok=True)
+                filename = os.path.join(directory, name)
+                shutil.move(os.path.join(root, name), filename)
+                outputs.append(filename)
+        self.cleanup()
+        write_json(self.path, {"inputs": self.inputs, "outputs": outputs})
+
+    def cleanup(self):
+        if self.staging:
+            shutil.rmtree(self.staging, ignore_errors=True)
+            self.staging = None
+
+    def invalidate(self):
+        self.cleanup()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,21 +1,29 @@
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from MyWizardPage import MyWizardPage
-from fontmake.font_project import FontProject
 from waitingspinnerwidget import QtWaitingSpinner
-import os, sys, subprocess
+from BuildTasks import (
+    BuildOptions,
+    run_fontmake_process,
+    run_pool,
+    fontmake_jobs,
+    can_instantiate_variable_font,
+    instance_tasks,
+    variable_font_args,
+    default_jobs,
+    has_mutatormath,
+    has_ttfautohint,
+    succeeded,
+    STATUS_UP_TO_DATE,
+    STATUS_CANCELLED,
+    workers,
+)
+from BuildProgress import format_timings
+from Instancer import instancer_jobs
+import os, sys, subprocess, threading
 from uuid import uuid1
 import os.path
 
-has_mutatormath = True
-has_ttfautohint = True
-try:
-  import mutatorMath
-except Exception as e:
-  has_mutatormath = False
-if os.system("ttfautohint -h"):
-  has_ttfautohint = False
-
 
 def open_file(filename):
     if sys.platform == "win32":
@@ -27,25 +35,72 @@ def open_file(filename):
 
 class FontmakeRunner(QObject):
     signalStatus = pyqtSignal(str, int, str)
-
-    def __init__(self, designspace_file, fontmake_args, task_id=0, parent=None):
+    signalProgress = pyqtSignal(str, object)
+
+    def __init__(
+        self,
+        designspace_file,
+        fontmake_args,
+        task_id=0,
+        use_cache=False,
+        timeout=None,
+        parent=None,
+    ):
         super(self.__class__, self).__init__(None)
         self.designspace_file = designspace_file
         self.fontmake_args = fontmake_args
         self.task_id = task_id
+        self.use_cache = use_cache
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        # Called from the GUI thread; our own thread is busy in start()
+        self.cancelled.set()
 
     @pyqtSlot()
     def start(self):
-        try:
-            print(self.designspace_file, self.fontmake_args)
-            FontProject().run_from_designspace(
-                self.designspace_file, **self.fontmake_args
-            )
-        except Exception as e:
-            print(e)
-            self.signalStatus.emit(self.task_id, 1, str(e))
-        else:
-            self.signalStatus.emit(self.task_id, 0, "")
+        status, message = run_fontmake_process(
+            self.designspace_file,
+            self.fontmake_args,
+            use_cache=self.use_cache,
+            progress=lambda event: self.signalProgress.emit(self.task_id, event),
+            cancel=self.cancelled,
+            timeout=self.timeout,
+        )
+        self.signalStatus.emit(self.task_id, status, message)
+
+
+class PoolRunner(QObject):
+    """Runs several independent build jobs (see BuildTasks.run_pool) in
+    parallel worker processes, reporting each one through signalStatus under
+    its own task id."""
+
+    signalStatus = pyqtSignal(str, int, str)
+    signalProgress = pyqtSignal(str, object)
+
+    def __init__(self, tasks, jobs, timeout=None, parent=None):
+        super(self.__class__, self).__init__(None)
+        self.tasks = tasks  # task_id -> (label, function, args)
+        self.jobs = jobs
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @pyqtSlot()
+    def start(self):
+        for task_id, status, message in run_pool(
+            self.tasks,
+            self.jobs,
+            progress=self.signalProgress.emit,
+            cancel=self.cancelled,
+            timeout=self.timeout,
+        ):
+            if not succeeded(status):
+                message = "%s: %s" % (self.tasks[task_id][0], message)
+            self.signalStatus.emit(task_id, status, message)
 
 
 class BuildFont(MyWizardPage):
@@ -55,6 +110,7 @@ class BuildFont(MyWizardPage):
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
         self.parent = parent
+        self.tasks = {}
 
     def build(self):
         # Turns out we have to build variable and static fonts separately
@@ -68,6 +124,9 @@ class BuildFont(MyWizardPage):
             return
 
         self.tasks = {}
+        self.variable_task = None
+        # TrueType instances cut from the variable font have to wait for it
+        self.instances_from_variable = self.buildOptions().instantiate_variable_font()
 
         if self.gen_vfont.isChecked():
             self.buildVfont()
@@ -75,53 +134,154 @@ class BuildFont(MyWizardPage):
         if self.buildInstances():
             self.doBuildInstances()
 
+    def buildOptions(self):
+        # Grab build options from UI
+        return BuildOptions(
+            autohint=self.autohint.isChecked(),
+            production_names=self.production_names.isChecked(),
+            remove_overlaps=self.remove_overlaps.isChecked(),
+            variable=self.gen_vfont.isChecked(),
+            output_instances=self.output_instances.isChecked(),
+            masters_as_instances=self.masters_as_instances.isChecked(),
+            use_mutatormath=self.mutator_math.isChecked(),
+            round_instances=self.round_instances.isChecked(),
+            instance_ttfs=self.instance_ttfs.isChecked(),
+            instance_otfs=self.instance_otfs.isChecked(),
+            jobs=self.jobs.value() if self.parallel_instances.isChecked() else 1,
+            use_cache=self.use_cache.isChecked(),
+            instances_from_variable=self.from_variable.isChecked(),
+        )
+
+    def addToQueue(self):
+        self.parent.showBuildQueue()
+        self.parent.build_queue.add(
+            self.designspace_file, self.buildOptions(), self.designspace
+        )
+
     def buildVfont(self):
-        args = {}
-        args["output"] = ["variable"]
-        args["output_dir"] = os.path.dirname(self.designspace_file)
-        self.addGeneralArgs(args)
-        self.runTask(args)
-
-    def addGeneralArgs(self, args):
-        # Grab fontmake arguments from UI
-        if self.autohint.isChecked():
-            args["autohint"] = ""
-        args["use_production_names"] = self.production_names.isChecked()
-        args["remove_overlaps"] = self.remove_overlaps.isChecked()
+        self.variable_task = self.runTask(
+            variable_font_args(self.designspace_file, self.buildOptions())
+        )
 
     def doBuildInstances(self):
-        os.chdir(os.path.dirname(self.designspace_file))
-        args = {}
-        args["output_dir"] = None
-
-        args["output"] = []
-        if self.instance_otfs.isChecked():
-            args["output"].append("otf")
-        if self.instance_ttfs.isChecked():
-            args["output"].append("ttf")
-
-        args["use_mutatormath"] = self.mutator_math.isChecked()
-        args["round_instances"] = self.round_instances.isChecked()
-        args["masters_as_instances"] = self.masters_as_instances.isChecked()
-        args["interpolate"] = True
-        self.addGeneralArgs(args)
-        self.runTask(args)
+        options = self.buildOptions()
+        tasks = instance_tasks(self.designspace_file, self.designspace, options)
+        if len(tasks) == 1:
+            self.runTask(tasks[0][1])
+        elif tasks:
+            self.runShardedTask(tasks, options.jobs)
+
+    def instantiateVfont(self):
+        options = self.buildOptions()
+        tasks = instancer_jobs(
+            self.designspace_file,
+            self.designspace,
+            options,
+            use_cache=self.use_cache.isChecked(),
+        )
+        self.runPool({str(uuid1()): task for task in tasks}, options.jobs)
 
     def runTask(self, args):
         task_id = str(uuid1())
-        worker = FontmakeRunner(self.designspace_file, args, task_id=task_id)
+        worker = FontmakeRunner(
+            self.designspace_file,
+            args,
+            task_id=task_id,
+            use_cache=self.use_cache.isChecked(),
+            timeout=self.timeout(),
+        )
+        self.startWorker(worker, [task_id])
+        return task_id
+
+    def runShardedTask(self, shards, jobs):
+        shards = {str(uuid1()): shard for shard in shards}
+        self.runPool(
+            fontmake_jobs(
+                self.designspace_file, shards, use_cache=self.use_cache.isChecked()
+            ),
+            jobs,
+        )
+
+    def runPool(self, tasks, jobs):
+        worker = PoolRunner(tasks, jobs, timeout=self.timeout())
+        self.startWorker(worker, list(tasks.keys()))
+
+    def timeout(self):
+        # In seconds, or None for no limit
+        return self.time_limit.value() * 60 or None
+
+    def startWorker(self, worker, task_ids):
         worker_thread = QThread()
         worker.moveToThread(worker_thread)
         worker_thread.started.connect(worker.start)
         worker.signalStatus.connect(self.show_results)
+        worker.signalProgress.connect(self.show_progress)
         if not self.spinner._isSpinning:
             print("Start the spinner")
             self.spinner.start()
+        self.buildlabel.setText("Building...")
         self.buildlabel.show()
-        worker_thread.start()
-        print("Running task ", task_id)
+        self.progress.setValue(0)
+        self.progress.show()
+        self.cancel_button.setEnabled(True)
+        self.cancel_button.show()
+        for task_id in task_ids:
+            print("Running task ", task_id)
+            self.tasks[task_id] = {
+                "worker": worker,
+                "thread": worker_thread,
+                "done": False,
+                "fraction": 0,
+                "timings": {},
+            }
         print(self.tasks)
-        self.tasks[task_id] = {"worker": worker, "thread": worker_thread, "done": False}
+        worker_thread.start()
+
+    def cancelBuild(self):
+        self.buildlabel.setText("Cancelling...")
+        self.cancel_button.setEnabled(False)
+        for worker in set([x["worker"] for x in self.tasks.values()]):
+            worker.cancel()
+
+    def stopBuilding(self):
+        """Kills any builds still running, without reporting on them. Used
+        when leaving the page or closing the window."""
+        running = [x["worker"] for x in self.tasks.values() if not x["done"]]
+        for worker in set(running):
+            worker.signalStatus.disconnect()
+            worker.signalProgress.disconnect()
+            worker.cancel()
+        for thread in set([x["thread"] for x in self.tasks.values()]):
+            thread.quit()
+            thread.wait()
+        self.tasks = {}
+
+    def cleanupPage(self):
+        self.stopBuilding()
+        super().cleanupPage()
+
+    def show_progress(self, task_id, event):
+        task = self.tasks[task_id]
+        task["fraction"] = event["fraction"]
+        if event["stage"] == "done":
+            task["timings"] = event["timings"]
+        else:
+            text = "%s (%.0fs)" % (event["label"], event["elapsed"])
+            if event["glyphs"]:
+                text = "%s, %i glyphs" % (text, event["glyphs"])
+            if event["task"]:
+                text = "%s: %s" % (event["task"], text)
+            self.buildlabel.setText(text)
+        fraction = sum([x["fraction"] for x in self.tasks.values()]) / len(self.tasks)
+        self.progress.setValue(int(fraction * self.progress.maximum()))
+
+    def timings(self):
+        # Total time spent in each stage, across all tasks
+        totals = {}
+        for task in self.tasks.values():
+            for stage, seconds in task["timings"].items():
+                totals[stage] = totals.get(stage, 0) + seconds
+        return totals
 
     def show_results(self, task_id, status, error_message):
         print("Task ", task_id, "completed")
@@ -130,14 +290,36 @@ class BuildFont(MyWizardPage):
         task["result"] = status
         task["message"] = error_message
         task["done"] = True
+        task["fraction"] = 1
+
+        if task_id == self.variable_task and self.instances_from_variable:
+            self.instances_from_variable = False
+            if succeeded(status):
+                self.instantiateVfont()
 
         if any([not x["done"] for x in self.tasks.values()]):  # More to come
             return
 
         # We are all done!
         self.buildlabel.hide()
+        self.progress.hide()
+        self.cancel_button.hide()
         self.spinner.stop()
-        if all([x["result"] == 0 for x in self.tasks.values()]):
+        failures = [
+            x["message"]
+            for x in self.tasks.values()
+            if not succeeded(x["result"]) and x["result"] != STATUS_CANCELLED
+        ]
+        if any([x["result"] == STATUS_CANCELLED for x in self.tasks.values()]):
+            msg = QMessageBox()
+            msg.setIcon(QMessageBox.Information)
+            msg.setText("Build cancelled")
+            msg.setWindowTitle("Cancelled")
+            if failures:
+                msg.setDetailedText("\n\n".join([x for x in failures if x]))
+            msg.setStandardButtons(QMessageBox.Ok)
+            self.saved = False
+        elif all([succeeded(x["result"]) for x in self.tasks.values()]):
             msg = QMessageBox()
             msg.setIcon(QMessageBox.Information)
             plural = ""
@@ -149,9 +331,20 @@ class BuildFont(MyWizardPage):
                 )
             ):
                 plural = "s"
-            msg.setText("Font%s created successfully" % plural)
+            if all([x["result"] == STATUS_UP_TO_DATE for x in self.tasks.values()]):
+                msg.setText(
+                    "Nothing has changed since the last build; font%s already up to date"
+                    % plural
+                )
+            else:
+                msg.setText("Font%s created successfully" % plural)
             msg.setWindowTitle("Success!")
             msg.setStandardButtons(QMessageBox.Ok)
+            if self.timings():
+                msg.setDetailedText(
+                    "Time spent in each stage of the build:\n\n"
+                    + format_timings(self.timings())
+                )
             self.saved = True
             open_file(os.path.dirname(self.designspace_file))
         else:
@@ -159,9 +352,7 @@ class BuildFont(MyWizardPage):
             msg.setIcon(QMessageBox.Critical)
             msg.setText("Variable font creation failed")
             msg.setWindowTitle("Error!")
-            msg.setDetailedText(
-                "\n\n".join([x["message"] for x in self.tasks.values()])
-            )
+            msg.setDetailedText("\n\n".join([x for x in failures if x]))
             msg.setStandardButtons(QMessageBox.Ok)
             self.saved = False
         msg.exec_()
@@ -175,6 +366,12 @@ class BuildFont(MyWizardPage):
         self.designspace_file = self.parent.designspace_file
         self.designspace = self.parent.designspace
         self.saved = False
+        self.tasks = {}
+        self.variable_task = None
+        self.instances_from_variable = False
+        # Get workers importing fontmake while the options are being chosen,
+        # one for the variable font and one for the instances
+        workers.warm(2)
 
         self.optionsScroll = QScrollArea()
         self.layout.addWidget(self.optionsScroll)
@@ -186,6 +383,17 @@ class BuildFont(MyWizardPage):
         self.buildlabel = QLabel("Building...")
         self.layout.addWidget(self.buildlabel)
         self.buildlabel.hide()
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 1000)
+        self.progress.setTextVisible(False)
+        self.cancel_button = QPushButton("Cancel build")
+        self.cancel_button.clicked.connect(self.cancelBuild)
+        self.progress_layout = QHBoxLayout()
+        self.progress_layout.addWidget(self.progress)
+        self.progress_layout.addWidget(self.cancel_button)
+        self.layout.addLayout(self.progress_layout)
+        self.progress.hide()
+        self.cancel_button.hide()
         self.spinner = QtWaitingSpinner(self)
         self.layout.addWidget(self.spinner)
 
@@ -210,6 +418,23 @@ class BuildFont(MyWizardPage):
         self.remove_overlaps = QCheckBox("Remove overlaps", checked=True)
         self.general_options_layout.addWidget(self.remove_overlaps)
 
+        self.use_cache = QCheckBox(
+            "Skip fonts whose sources haven't changed since the last build",
+            checked=True,
+        )
+        self.general_options_layout.addWidget(self.use_cache)
+
+        self.time_limit = QSpinBox()
+        self.time_limit.setRange(0, 24 * 60)
+        self.time_limit.setSuffix(" minutes")
+        self.time_limit.setSpecialValueText("No limit")
+        self.time_limit.setToolTip("Builds which take longer than this are stopped")
+        self.time_limit_layout = QHBoxLayout()
+        self.time_limit_layout.addWidget(QLabel("Give up on any one build after:"))
+        self.time_limit_layout.addWidget(self.time_limit)
+        self.time_limit_layout.addStretch()
+        self.general_options_layout.addLayout(self.time_limit_layout)
+
         self.optionsLayout.addWidget(self.general_options)
 
         # Varfont stuff
@@ -257,11 +482,41 @@ class BuildFont(MyWizardPage):
         self.instance_otfs = QCheckBox("Create CFF instances", checked=False)
         self.instance_ttfs = QCheckBox("Create TrueType instances", checked=False)
 
+        self.parallel_instances = QCheckBox(
+            "Build instances in parallel", checked=True
+        )
+        self.jobs = QSpinBox()
+        self.jobs.setMinimum(1)
+        self.jobs.setMaximum(max(default_jobs(), 64))
+        self.jobs.setValue(default_jobs())
+        self.jobs.setToolTip("Number of worker processes used to build instances")
+        self.parallel_instances.stateChanged.connect(
+            lambda: self.jobs.setEnabled(
+                self.buildInstances() and self.parallel_instances.isChecked()
+            )
+        )
+        self.jobs_layout = QHBoxLayout()
+        self.jobs_layout.addWidget(self.parallel_instances)
+        self.jobs_layout.addWidget(QLabel("Worker processes:"))
+        self.jobs_layout.addWidget(self.jobs)
+
+        self.from_variable = QCheckBox(
+            "Make TrueType instances from the variable font (faster)", checked=False
+        )
+        self.from_variable.setToolTip(
+            "Cuts each instance out of the compiled variable font instead of"
+            " interpolating it from the sources"
+        )
+        self.gen_vfont.stateChanged.connect(self.enableInstances)
+        self.instance_ttfs.stateChanged.connect(self.enableInstances)
+
         self.instance_widgets = [
             self.mutator_math,
             self.round_instances,
             self.instance_ttfs,
             self.instance_otfs,
+            self.parallel_instances,
+            self.jobs,
         ]
         self.enableInstances()
 
@@ -269,8 +524,25 @@ class BuildFont(MyWizardPage):
         self.instance_ttfs.setChecked(True)
         self.instance_options_layout.addWidget(self.instance_ttfs)
         self.instance_options_layout.addWidget(self.instance_otfs)
+        self.instance_options_layout.addWidget(self.from_variable)
+        self.instance_options_layout.addLayout(self.jobs_layout)
 
         self.optionsLayout.addWidget(self.instance_options)
+
+        # Queueing this designspace to be built along with others
+        self.queue_layout = QHBoxLayout()
+        self.queue_button = QPushButton("Add to build queue")
+        self.queue_button.setToolTip(
+            "Build this designspace with these options later, together with"
+            " other designspaces"
+        )
+        self.queue_button.clicked.connect(self.addToQueue)
+        self.show_queue_button = QPushButton("Show build queue")
+        self.show_queue_button.clicked.connect(self.parent.showBuildQueue)
+        self.queue_layout.addStretch()
+        self.queue_layout.addWidget(self.queue_button)
+        self.queue_layout.addWidget(self.show_queue_button)
+        self.optionsLayout.addLayout(self.queue_layout)
         self.optionsScroll.setWidgetResizable(True)
 
         self.parent.setButtonLayout(
@@ -297,3 +569,9 @@ class BuildFont(MyWizardPage):
         else:
             for w in self.instance_widgets:
                 w.setEnabled(False)
+        self.from_variable.setEnabled(
+            self.buildInstances()
+            and self.gen_vfont.isChecked()
+            and self.instance_ttfs.isChecked()
+            and can_instantiate_variable_font(self.designspace)
+        )
@@ -0,0 +1,337 @@
+"""Turns fontmake's log output into structured progress events.
+
+fontmake, ufo2ft and varLib announce what they are doing through the logging
+module; BuildProgress listens to those messages while a build runs, works out
+which stage of the build we are in and reports each change of stage (with
+elapsed times and glyph counts) to a callback. The time spent in each stage
+is appended to a per-designspace timings file in the cache when the build
+finishes."""
+
+import json
+import logging
+import os
+import plistlib
+import re
+import threading
+import time
+
+from fontTools.designspaceLib import DesignSpaceDocument
+
+from Cache import cache_dir, key_for
+
+STAGES = [
+    ("load", "Loading sources"),
+    ("interpolate", "Interpolating instances"),
+    ("preprocess", "Pre-processing glyphs and removing overlaps"),
+    ("outlines", "Compiling outlines"),
+    ("features", "Compiling features"),
+    ("merge", "Merging variable font"),
+    ("autohint", "Autohinting"),
+    ("save", "Saving"),
+    ("instance", "Instancing from the variable font"),
+]
+STAGE_LABELS = dict(STAGES)
+
+# The stages each output font goes through, for working out how far along
+# we are once the shared stages (loading, interpolating) are done.
+FONT_STAGES = ["preprocess", "outlines", "features", "merge", "autohint", "save"]
+
+# (logger name prefix, message regex, stage)
+RULES = [
+    ("fontmake", r"^Loading .* source UFOs", "load"),
+    (
+        "fontmake",
+        r"^(Interpolating master UFOs|Generating instance UFO)",
+        "interpolate",
+    ),
+    ("fontmake", r"^Building \w+ for ", "preprocess"),
+    ("ufo2ft", r"^Pre-processing glyphs", "preprocess"),
+    ("ufo2ft.filters", r"^Running ", "preprocess"),
+    ("ufo2ft", r"^Building OpenType tables", "outlines"),
+    ("ufo2ft.timer", r"to compile a basic", "features"),
+    ("ufo2ft", r"^Building variable font", "merge"),
+    ("ufo2ft", r"^Compiling (variable )?features", "features"),
+    ("fontmake", r"^Autohinting ", "autohint"),
+    ("fontmake", r"^Saving ", "save"),
+]
+RULES = [(name, re.compile(regex), stage) for name, regex, stage in RULES]
+
+GLYPH_COUNT = re.compile(r" on (\d+) glyphs")
+FONT_FILE = re.compile(r"\.(ttf|otf|woff2?)$")
+
+# The loggers we listen to, and how verbose they need to be for us to see
+# the messages we care about.
+LOGGER_LEVELS = {
+    "fontmake": logging.INFO,
+    "ufo2ft": logging.INFO,
+    "ufo2ft.timer": logging.DEBUG,
+}
+
+# How often pool runners check for progress events from their workers
+UPDATE_INTERVAL = 0.25
+
+# Runs of each build (each set of fontmake arguments) kept in a designspace's
+# timings file; expected_duration looks at the last few
+KEEP_RUNS = 10
+
+
+def glyph_count(ufo_path):
+    try:
+        with open(os.path.join(ufo_path, "glyphs", "contents.plist"), "rb") as f:
+            return len(plistlib.load(f))
+    except (OSError, ValueError):
+        return 0
+
+
+def expected_fonts(designspace, fontmake_args):
+    """How many font files a fontmake run with these arguments should save."""
+    formats = len(fontmake_args.get("output", [])) or 1
+    if "variable" in fontmake_args.get("output", []):
+        return 1
+    count = 0
+    interpolate = fontmake_args.get("interpolate")
+    if interpolate is True:
+        count += len(designspace.instances)
+    elif interpolate:
+        count += len(
+            [
+                x
+                for x in designspace.instances
+                if x.name and re.match(interpolate, x.name)
+            ]
+        )
+    if fontmake_args.get("masters_as_instances"):
+        count += len(designspace.sources)
+    return max(count * formats, 1)
+
+
+def timings_file(designspace_file):
+    return os.path.join(
+        cache_dir("timings"), key_for(os.path.abspath(designspace_file)) + ".jsonl"
+    )
+
+
+def read_timings(designspace_file):
+    """The runs recorded in a designspace's timings file, oldest first."""
+    entries = []
+    try:
+        with open(timings_file(designspace_file), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def expected_duration(designspace_file, fontmake_args):
+    """How long a build of this designspace with these arguments has taken
+    recently (the median of the last few runs), or None if it hasn't been
+    built before."""
+    key = key_for(fontmake_args)
+    totals = [
+        entry["total"]
+        for entry in read_timings(designspace_file)
+        if key_for(entry.get("args")) == key and "total" in entry
+    ]
+    if not totals:
+        return None
+    recent = sorted(totals[-5:])
+    return recent[len(recent) // 2]
+
+
+def format_timings(timings):
+    lines = []
+    for stage, label in STAGES:
+        if stage in timings:
+            lines.append("%s: %.1fs" % (label, timings[stage]))
+    lines.append("Total: %.1fs" % sum(timings.values()))
+    return "\n".join(lines)
+
+
+class Dispatcher(logging.Handler):
+    """While any build is being watched, the loggers in LOGGER_LEVELS are
+    turned up and stop propagating; their records come here instead. Each
+    record goes to the BuildProgress for the thread which logged it, and is
+    passed on to the application's handlers only if it would have got there
+    before we lowered the levels."""
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.watchers = {}
+        self.saved = {}
+        self.lock = threading.Lock()
+
+    def watch(self, watcher):
+        with self.lock:
+            if not self.watchers:
+                for name, level in LOGGER_LEVELS.items():
+                    logger = logging.getLogger(name)
+                    self.saved[name] = (
+                        logger.level,
+                        logger.propagate,
+                        logger.getEffectiveLevel(),
+                    )
+                    logger.setLevel(min(level, logger.getEffectiveLevel()))
+                    logger.propagate = False
+                    logger.addHandler(self)
+            self.watchers[watcher.thread] = watcher
+
+    def unwatch(self, watcher):
+        with self.lock:
+            self.watchers.pop(watcher.thread, None)
+            if not self.watchers:
+                for name, (level, propagate, effective) in self.saved.items():
+                    logger = logging.getLogger(name)
+                    logger.removeHandler(self)
+                    logger.setLevel(level)
+                    logger.propagate = propagate
+                self.saved = {}
+
+    def threshold(self, name):
+        """The level a record from this logger needed before we meddled."""
+        while name not in self.saved and "." in name:
+            name = name.rsplit(".", 1)[0]
+        return self.saved.get(name, (0, True, logging.WARNING))[2]
+
+    def emit(self, record):
+        watcher = self.watchers.get(record.thread)
+        if watcher:
+            watcher.observe(record)
+        if record.levelno >= self.threshold(record.name):
+            logging.getLogger().handle(record)
+
+
+dispatcher = Dispatcher()
+
+
+class BuildProgress:
+    """Use as a context manager around a fontmake run. Each event passed to
+    `callback` is a dict with the current `stage` and its `label`, the time
+    `elapsed` since the build started, the `stage_elapsed`, the number of
+    `glyphs` being worked on and an overall `fraction` done. The final event
+    has the stage "done" and the per-stage `timings`."""
+
+    def __init__(self, designspace_file, fontmake_args, callback, label=""):
+        self.designspace_file = designspace_file
+        self.fontmake_args = fontmake_args
+        self.callback = callback
+        self.label = label
+        designspace = DesignSpaceDocument.fromfile(designspace_file)
+        default = designspace.findDefault() or (
+            designspace.sources[0] if designspace.sources else None
+        )
+        self.total_glyphs = glyph_count(default.path) if default else 0
+        self.expected_fonts = expected_fonts(designspace, fontmake_args)
+        self.thread = threading.get_ident()
+
+    def __enter__(self):
+        self.started = self.stage_started = time.monotonic()
+        self.stage = None
+        self.glyphs = 0
+        self.fonts_done = 0
+        self.done_fraction = 0
+        self.saving_font = False
+        self.timings = {}
+        dispatcher.watch(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        dispatcher.unwatch(self)
+        self.end_stage()
+        if exc_type is None:
+            self.record()
+            self.report("done", fraction=1.0, timings=dict(self.timings))
+        return False
+
+    def end_stage(self):
+        if self.stage:
+            now = time.monotonic()
+            self.timings[self.stage] = (
+                self.timings.get(self.stage, 0) + now - self.stage_started
+            )
+            if self.stage == "save" and self.saving_font:
+                self.fonts_done += 1
+
+    def fraction(self):
+        if self.stage in FONT_STAGES:
+            within = FONT_STAGES.index(self.stage) / len(FONT_STAGES)
+        else:
+            within = 0
+        # Stages don't always come in the same order (variable fonts are
+        # merged before their features are compiled), so never go backwards
+        fraction = min((self.fonts_done + within) / self.expected_fonts, 0.99)
+        self.done_fraction = max(self.done_fraction, fraction)
+        return self.done_fraction
+
+    def report(self, stage, **kwargs):
+        now = time.monotonic()
+        event = {
+            "stage": stage,
+            "label": STAGE_LABELS.get(stage, stage),
+            "task": self.label,
+            "elapsed": now - self.started,
+            "stage_elapsed": now - self.stage_started,
+            "glyphs": self.glyphs,
+            "fraction": self.fraction(),
+        }
+        event.update(kwargs)
+        self.callback(event)
+
+    def observe(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            return
+
+        counted = GLYPH_COUNT.search(message)
+        if counted:
+            self.glyphs = int(counted.group(1))
+
+        for name, regex, stage in RULES:
+            if record.name.startswith(name) and regex.search(message):
+                break
+        else:
+            return
+        if stage == self.stage and stage != "save":
+            return
+        self.end_stage()
+        self.stage = stage
+        self.stage_started = time.monotonic()
+        self.saving_font = stage == "save" and bool(FONT_FILE.search(message))
+        self.glyphs = self.total_glyphs
+        self.report(stage)
+
+    def record(self):
+        """Adds this build's stage timings to the designspace's timings
+        file, where they can be compared between runs. The file is rewritten
+        with only the last KEEP_RUNS runs of each build, so it stays small
+        however often the designspace is built."""
+        entry = {
+            "task": self.label,
+            "args": self.fontmake_args,
+            "finished": time.time(),
+            "timings": self.timings,
+            "total": time.monotonic() - self.started,
+        }
+        entries = read_timings(self.designspace_file) + [entry]
+        runs = {}
+        kept = []
+        for entry in reversed(entries):
+            key = key_for(entry.get("args"))
+            runs[key] = runs.get(key, 0) + 1
+            if runs[key] <= KEEP_RUNS:
+                kept.append(entry)
+        path = timings_file(self.designspace_file)
+        # Written then renamed, as other builds of the designspace may be
+        # reading it; a run recorded by one of them meanwhile may be lost
+        tmp = "%s.%i.tmp" % (path, os.getpid())
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in reversed(kept):
+                    f.write(json.dumps(entry, sort_keys=True, default=str) + "\n")
+            os.replace(tmp, path)
+        except OSError:
+            pass
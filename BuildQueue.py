@@ -0,0 +1,157 @@
+"""Builds several designspaces at once, sharing one pool of workers.
+
+Each queued designspace is turned into the same build jobs the build page
+would run (the variable font, batches of static instances, and instances cut
+from the variable font), and all of them are scheduled together under one
+concurrency limit. Jobs expected to take longest, going by the timings
+recorded for earlier builds, are started first so that one slow family
+doesn't leave the other cores idle at the end of a catalogue rebuild.
+
+`pilcrow build` queues its designspaces here as well, without starting the
+GUI, so this module mustn't import Qt."""
+
+import copy
+import os
+
+from fontTools.designspaceLib import DesignSpaceDocument
+
+from BuildTasks import (
+    fontmake_jobs,
+    instance_tasks,
+    run_pool,
+    variable_font_args,
+)
+from BuildProgress import expected_duration, expected_fonts, glyph_count
+from Instancer import instancer_jobs
+
+# Rough guesses, in seconds, for jobs which have never been timed: compiling
+# a glyph for one font with fontmake, and cutting an instance from a
+# variable font
+SECONDS_PER_GLYPH = 0.01
+SECONDS_PER_INSTANCE = 1.0
+
+
+class QueueEntry:
+    """A designspace waiting to be built, and the options to build it with."""
+
+    def __init__(self, designspace_file, options, designspace=None):
+        self.designspace_file = os.path.abspath(designspace_file)
+        self.designspace = designspace or DesignSpaceDocument.fromfile(
+            self.designspace_file
+        )
+        self.options = copy.copy(options)
+        if not self.designspace.instances:
+            self.options.output_instances = False
+
+    @property
+    def name(self):
+        # Families often keep their designspaces under the same name in
+        # different directories
+        directory, filename = os.path.split(self.designspace_file)
+        return os.path.join(os.path.basename(directory), filename)
+
+    def glyphs(self):
+        default = self.designspace.findDefault() or (
+            self.designspace.sources[0] if self.designspace.sources else None
+        )
+        return glyph_count(default.path) if default else 0
+
+    def jobs(self):
+        """Returns (label, function, args, expected seconds, prerequisite
+        label) for each job needed to build this entry."""
+        options = self.options
+        fontmake = []
+        if options.variable:
+            fontmake.append(
+                ("Variable font", variable_font_args(self.designspace_file, options))
+            )
+        if options.build_instances():
+            fontmake.extend(
+                instance_tasks(self.designspace_file, self.designspace, options)
+            )
+
+        jobs = []
+        for label, args in fontmake:
+            expected = expected_duration(self.designspace_file, args)
+            if expected is None:
+                fonts = expected_fonts(self.designspace, args)
+                expected = self.glyphs() * fonts * SECONDS_PER_GLYPH
+            (task,) = fontmake_jobs(
+                self.designspace_file, {label: (label, args)}, options.use_cache
+            ).values()
+            jobs.append(task + (expected, None))
+
+        if options.instantiate_variable_font():
+            for task in instancer_jobs(
+                self.designspace_file,
+                self.designspace,
+                options,
+                use_cache=options.use_cache,
+            ):
+                jobs.append(task + (SECONDS_PER_INSTANCE, "Variable font"))
+        return jobs
+
+
+class BuildQueue:
+    def __init__(self):
+        self.entries = []
+        self.planned = {}
+
+    def add(self, designspace_file, options, designspace=None):
+        entry = QueueEntry(designspace_file, options, designspace)
+        self.entries.append(entry)
+        return entry
+
+    def remove(self, entry):
+        self.entries.remove(entry)
+
+    def plan(self):
+        """Works out every job in the queue. Returns the jobs in the order
+        they should start, as run_pool wants them, and the dependencies
+        between them. Keys are "<entry>:<job>" strings.
+
+        A job's priority is how long it is expected to take plus the longest
+        job waiting for it, so that a variable font with instances to be cut
+        from it starts early."""
+        self.planned = {}
+        tasks = {}
+        after = {}
+        priority = {}
+        for i, entry in enumerate(self.entries):
+            keys = {}
+            jobs = entry.jobs()
+            for j, (label, function, args, expected, prerequisite) in enumerate(jobs):
+                key = "%i:%i" % (i, j)
+                keys[label] = key
+                tasks[key] = (label, function, args)
+                priority[key] = expected
+                self.planned[key] = (entry, label, expected)
+            for j, (label, function, args, expected, prerequisite) in enumerate(jobs):
+                if prerequisite in keys:
+                    key = "%i:%i" % (i, j)
+                    after[key] = keys[prerequisite]
+                    priority[keys[prerequisite]] = max(
+                        priority[keys[prerequisite]],
+                        self.planned[keys[prerequisite]][2] + expected,
+                    )
+        order = sorted(tasks, key=lambda key: -priority[key])
+        return {key: tasks[key] for key in order}, after
+
+    def task(self, key):
+        """The (entry, label, expected seconds) of a planned job."""
+        return self.planned[key]
+
+    def run(self, jobs, progress=None, cancel=None, timeout=None, started=None):
+        """Plans and runs everything in the queue, at most `jobs` at a time;
+        yields (key, status, message) as each job finishes. The other
+        arguments are as for run_pool."""
+        tasks, after = self.plan()
+        return run_pool(
+            tasks,
+            jobs,
+            progress=progress,
+            cancel=cancel,
+            timeout=timeout,
+            after=after,
+            started=started,
+        )
@@ -0,0 +1,213 @@
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from BuildQueue import BuildQueue
+from BuildTasks import (
+    BuildOptions,
+    STATUS_OK,
+    STATUS_FAILED,
+    STATUS_UP_TO_DATE,
+    STATUS_CANCELLED,
+    default_jobs,
+)
+import copy, threading
+
+STATUS_TEXT = {
+    STATUS_OK: "Built",
+    STATUS_FAILED: "Failed",
+    STATUS_UP_TO_DATE: "Up to date",
+    STATUS_CANCELLED: "Cancelled",
+}
+
+
+class QueueRunner(QObject):
+    signalStarted = pyqtSignal(str)
+    signalStatus = pyqtSignal(str, int, str)
+    signalProgress = pyqtSignal(str, object)
+    signalFinished = pyqtSignal()
+
+    def __init__(self, queue, jobs, parent=None):
+        super(self.__class__, self).__init__(None)
+        self.queue = queue
+        self.jobs = jobs
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @pyqtSlot()
+    def start(self):
+        for key, status, message in self.queue.run(
+            self.jobs,
+            progress=self.signalProgress.emit,
+            cancel=self.cancelled,
+            started=self.signalStarted.emit,
+        ):
+            self.signalStatus.emit(key, status, message)
+        self.signalFinished.emit()
+
+
+class BuildQueueDialog(QDialog):
+    """A window listing designspaces queued to be built together, with the
+    status of each of their build jobs."""
+
+    def __init__(self, parent=None):
+        super(QDialog, self).__init__(parent)
+        self.setWindowTitle("Build queue")
+        self.resize(700, 400)
+        self.queue = BuildQueue()
+        self.options = None
+        self.rows = {}
+        self.thread = None
+
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(
+            ["Designspace", "Build", "Expected", "Status"]
+        )
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.layout.addWidget(self.table)
+
+        self.jobs = QSpinBox()
+        self.jobs.setMinimum(1)
+        self.jobs.setMaximum(max(default_jobs(), 64))
+        self.jobs.setValue(default_jobs())
+        self.jobs.setToolTip("Number of builds to run at once, across all designspaces")
+
+        self.add_button = QPushButton("Add designspaces...")
+        self.add_button.clicked.connect(self.addFiles)
+        self.remove_button = QPushButton("Remove")
+        self.remove_button.clicked.connect(self.removeSelected)
+        self.start_button = QPushButton("Build all")
+        self.start_button.clicked.connect(self.start)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel)
+        self.cancel_button.setEnabled(False)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.add_button)
+        buttons.addWidget(self.remove_button)
+        buttons.addStretch()
+        buttons.addWidget(QLabel("Builds at once:"))
+        buttons.addWidget(self.jobs)
+        buttons.addWidget(self.start_button)
+        buttons.addWidget(self.cancel_button)
+        self.layout.addLayout(buttons)
+        self.summary = QLabel("")
+        self.layout.addWidget(self.summary)
+
+    def add(self, designspace_file, options, designspace=None):
+        """Queues a designspace with the given BuildOptions, which are also
+        used for designspaces added from this window later."""
+        self.options = copy.copy(options)
+        self.queue.add(designspace_file, options, designspace)
+        self.refresh()
+
+    def addFiles(self):
+        filenames, _ = QFileDialog.getOpenFileNames(
+            self, "Add designspaces", filter="Designspace file (*.designspace)"
+        )
+        for filename in filenames:
+            try:
+                self.queue.add(filename, self.options or self.defaultOptions())
+            except Exception as e:
+                QMessageBox.warning(self, "Couldn't add designspace", str(e))
+        self.refresh()
+
+    def defaultOptions(self):
+        # The build page's defaults
+        return BuildOptions(output_instances=True, masters_as_instances=True)
+
+    def removeSelected(self):
+        entries = set()
+        for index in self.table.selectionModel().selectedRows():
+            key = self.table.item(index.row(), 0).data(Qt.UserRole)
+            entries.add(self.queue.task(key)[0])
+        for entry in entries:
+            self.queue.remove(entry)
+        self.refresh()
+
+    def refresh(self):
+        """Lists the jobs the queue would run, in the order they'd start."""
+        tasks, after = self.queue.plan()
+        self.rows = {}
+        self.table.setRowCount(len(tasks))
+        for row, key in enumerate(tasks):
+            entry, label, expected = self.queue.task(key)
+            name = QTableWidgetItem(entry.name)
+            name.setData(Qt.UserRole, key)
+            name.setToolTip(entry.designspace_file)
+            self.table.setItem(row, 0, name)
+            self.table.setItem(row, 1, QTableWidgetItem(label))
+            self.table.setItem(row, 2, QTableWidgetItem("%.0fs" % expected))
+            status = "Waiting for %s" % tasks[after[key]][0] if key in after else ""
+            self.table.setItem(row, 3, QTableWidgetItem(status or "Queued"))
+            self.rows[key] = row
+        self.summary.setText(
+            "%i designspaces, %i builds" % (len(self.queue.entries), len(tasks))
+        )
+
+    def setStatus(self, key, text):
+        if key in self.rows:
+            self.table.item(self.rows[key], 3).setText(text)
+
+    def start(self):
+        if not self.queue.entries or self.thread:
+            return
+        self.refresh()
+        self.done = 0
+        self.failed = 0
+        self.runner = QueueRunner(self.queue, self.jobs.value())
+        self.thread = QThread()
+        self.runner.moveToThread(self.thread)
+        self.thread.started.connect(self.runner.start)
+        self.runner.signalStarted.connect(lambda key: self.setStatus(key, "Building"))
+        self.runner.signalProgress.connect(self.showProgress)
+        self.runner.signalStatus.connect(self.showStatus)
+        self.runner.signalFinished.connect(self.finished)
+        for w in [self.add_button, self.remove_button, self.start_button]:
+            w.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.thread.start()
+
+    def showProgress(self, key, event):
+        if event["stage"] != "done":
+            self.setStatus(key, "%s (%.0fs)" % (event["label"], event["elapsed"]))
+
+    def showStatus(self, key, status, message):
+        self.done += 1
+        text = STATUS_TEXT.get(status, "Failed")
+        if status == STATUS_FAILED:
+            self.failed += 1
+            self.table.item(self.rows[key], 3).setToolTip(message)
+            text = "Failed: %s" % message.splitlines()[0] if message else text
+        self.setStatus(key, text)
+        self.summary.setText(
+            "%i of %i builds finished, %i failed"
+            % (self.done, len(self.rows), self.failed)
+        )
+
+    def cancel(self):
+        self.cancel_button.setEnabled(False)
+        if self.thread:
+            self.runner.cancel()
+
+    def finished(self):
+        self.thread.quit()
+        self.thread.wait()
+        self.thread = None
+        for w in [self.add_button, self.remove_button, self.start_button]:
+            w.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def stopBuilding(self):
+        # Used when Pilcrow is closing
+        if self.thread:
+            self.runner.signalStatus.disconnect()
+            self.runner.signalFinished.disconnect()
+            self.runner.cancel()
+            self.thread.quit()
+            self.thread.wait()
+            self.thread = None
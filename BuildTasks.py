@@ -0,0 +1,600 @@
+import contextlib
+import importlib
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import connection
+
+from BuildCache import BuildCache
+from BuildProgress import BuildProgress, UPDATE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Worker processes are always spawned rather than forked: forking a process
+# which is running a Qt event loop (and possibly other threads) is not safe.
+mp_context = multiprocessing.get_context("spawn")
+
+STATUS_OK = 0
+STATUS_FAILED = 1
+STATUS_UP_TO_DATE = 2
+STATUS_CANCELLED = 3
+
+# How long a build process has to exit after being asked to, before it is
+# killed
+KILL_GRACE = 2
+
+has_mutatormath = True
+has_ttfautohint = True
+try:
+    import mutatorMath
+except Exception as e:
+    has_mutatormath = False
+try:
+    subprocess.call(
+        ["ttfautohint", "-h"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+except OSError:
+    has_ttfautohint = False
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+class BuildOptions:
+    """The choices which drive a build, whether they come from the build
+    page's checkboxes or from the command line."""
+
+    def __init__(
+        self,
+        autohint=False,
+        production_names=True,
+        remove_overlaps=True,
+        variable=True,
+        output_instances=False,
+        masters_as_instances=False,
+        use_mutatormath=False,
+        round_instances=True,
+        instance_ttfs=True,
+        instance_otfs=False,
+        jobs=1,
+        use_cache=True,
+        instances_from_variable=False,
+    ):
+        self.autohint = autohint
+        self.production_names = production_names
+        self.remove_overlaps = remove_overlaps
+        self.variable = variable
+        self.output_instances = output_instances
+        self.masters_as_instances = masters_as_instances
+        self.use_mutatormath = use_mutatormath
+        self.round_instances = round_instances
+        self.instance_ttfs = instance_ttfs
+        self.instance_otfs = instance_otfs
+        self.jobs = jobs
+        self.use_cache = use_cache
+        self.instances_from_variable = instances_from_variable
+
+    def build_instances(self):
+        return self.masters_as_instances or self.output_instances
+
+    def instantiate_variable_font(self):
+        """Whether the TrueType instances are cut from the variable font
+        rather than built from the sources."""
+        return (
+            self.instances_from_variable
+            and self.variable
+            and self.instance_ttfs
+            and self.build_instances()
+        )
+
+
+def add_general_args(args, options):
+    if options.autohint:
+        args["autohint"] = ""
+    args["use_production_names"] = options.production_names
+    args["remove_overlaps"] = options.remove_overlaps
+
+
+def variable_font_path(designspace_file):
+    """Where the variable font is built when instances are made from it."""
+    stem = os.path.splitext(os.path.basename(designspace_file))[0]
+    return os.path.join(
+        os.path.dirname(os.path.abspath(designspace_file)), stem + "-VF.ttf"
+    )
+
+
+def can_instantiate_variable_font(designspace):
+    # A designspace describing several variable fonts doesn't give us a
+    # single font to cut the instances from
+    return len(getattr(designspace, "variableFonts", [])) <= 1
+
+
+def variable_font_args(designspace_file, options):
+    args = {}
+    args["output"] = ["variable"]
+    if options.instantiate_variable_font():
+        # The instancer needs to know where to find it
+        args["output_path"] = variable_font_path(designspace_file)
+    else:
+        args["output_dir"] = os.path.dirname(os.path.abspath(designspace_file))
+    add_general_args(args, options)
+    return args
+
+
+def instance_formats(options):
+    """The formats for which fontmake builds static instances."""
+    formats = []
+    if options.instance_otfs:
+        formats.append("otf")
+    if options.instance_ttfs and not options.instantiate_variable_font():
+        formats.append("ttf")
+    return formats
+
+
+def instance_args(designspace_file, options, fmt):
+    """Arguments for building the static instances in one format. Each
+    format is written to its own instance_<format> directory next to the
+    designspace, as fontmake does by default, but without relying on the
+    working directory."""
+    args = {}
+    args["output_dir"] = os.path.join(
+        os.path.dirname(os.path.abspath(designspace_file)), "instance_" + fmt
+    )
+    args["output"] = [fmt]
+
+    args["use_mutatormath"] = options.use_mutatormath
+    args["round_instances"] = options.round_instances
+    args["masters_as_instances"] = options.masters_as_instances
+    args["interpolate"] = True
+    add_general_args(args, options)
+    return args
+
+
+def instance_tasks(designspace_file, designspace, options):
+    """Returns the (label, args) pairs for building the static instances:
+    one per output format, each split into shards when building with more
+    than one job."""
+    formats = instance_formats(options)
+    tasks = []
+    for fmt in formats:
+        args = instance_args(designspace_file, options, fmt)
+        if options.jobs > 1:
+            shards = instance_shards(designspace, args, options.jobs)
+        else:
+            shards = [("Instances", args)]
+        if len(formats) > 1:
+            shards = [("%s: %s" % (fmt.upper(), label), x) for label, x in shards]
+        tasks.extend(shards)
+    return tasks
+
+
+def succeeded(status):
+    return status in (STATUS_OK, STATUS_UP_TO_DATE)
+
+
+def run_fontmake(
+    designspace_file, fontmake_args, use_cache=False, progress=None, label=""
+):
+    """Runs a single fontmake build, returning a (status, message) pair.
+
+    This is what each build process runs, so it must stay importable
+    without Qt. With `use_cache`, a
+    build whose inputs and outputs are unchanged since last time is skipped
+    and reported as STATUS_UP_TO_DATE. If given, `progress` is called with
+    each of the BuildProgress events."""
+    cache = None
+    try:
+        if use_cache:
+            cache = BuildCache(designspace_file, fontmake_args)
+            if cache.up_to_date():
+                logger.info("Up to date: %s %s", designspace_file, fontmake_args)
+                return STATUS_UP_TO_DATE, ""
+        reporter = None
+        if progress:
+            reporter = BuildProgress(designspace_file, fontmake_args, progress, label)
+        if cache:
+            fontmake_args = cache.begin()
+        logger.info("Building %s %s", designspace_file, fontmake_args)
+        # Imported here so that the compatibility check's workers, which
+        # share this module's mp_context and default_jobs, don't load fontmake
+        from fontmake.font_project import FontProject
+
+        with reporter or contextlib.nullcontext():
+            FontProject().run_from_designspace(designspace_file, **fontmake_args)
+    except Exception as e:
+        logger.error("%s: %s", designspace_file, e)
+        if cache:
+            cache.invalidate()
+        return STATUS_FAILED, str(e)
+    if cache:
+        cache.commit()
+    return STATUS_OK, ""
+
+
+# Optional parts of the build stack which workers import up front, so that
+# the first build to need them doesn't pay for it
+WARM_IMPORTS = [
+    "fontmake.font_project",
+    "ufo2ft.featureCompiler",
+    "ufo2ft.outlineCompiler",
+    "ufo2ft.filters.decomposeTransformedComponents",
+    "fontTools.varLib",
+    "fontTools.varLib.mutator",
+    "fontTools.varLib.instancer",
+    "fontTools.subset",
+    "booleanOperations",
+    "cffsubr",
+    "compreffor",
+]
+
+# Workers are retired after this many builds, in case fontmake or its
+# dependencies leak memory between runs
+MAX_BUILDS_PER_WORKER = 25
+
+
+def worker_main(conn):
+    """The body of a warm worker process: imports the build stack once, then
+    runs each job it is sent. A job is a function (such as run_fontmake)
+    with its arguments; the worker replies with ("progress", event) messages
+    and finally the function's ("result", status, message)."""
+    # The worker shares the parent's stdout, which may be carrying a report
+    # (`pilcrow build --format json`); anything printed during a build is
+    # for people, so send it to stderr
+    sys.stdout = sys.stderr
+    for module in WARM_IMPORTS:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+    progress = lambda event: conn.send(("progress", event))
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        function, args, label = job
+        status, message = function(*args, progress=progress, label=label)
+        conn.send(("result", status, message))
+
+
+class Worker:
+    """A build process which is kept warm between builds. Builds run out of
+    process so that they don't compete with the GUI for the GIL and can't
+    take the application down with them if they crash."""
+
+    def __init__(self):
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=worker_main, args=(child_conn,), daemon=True
+        )
+        self.process.start()
+        # Only the child should hold its end, so that we see EOF if it dies
+        child_conn.close()
+        self.builds = 0
+        self.key = None
+        self.result = None
+
+    def alive(self):
+        return not self.conn.closed and self.process.is_alive()
+
+    def submit(self, key, label, function, args):
+        self.key = key
+        self.label = label
+        self.result = None
+        self.started = time.monotonic()
+        self.builds += 1
+        self.conn.send((function, args, label))
+
+    def drain(self, progress):
+        try:
+            while self.result is None and self.conn.poll():
+                message = self.conn.recv()
+                if message[0] == "progress":
+                    if progress:
+                        progress(self.key, message[1])
+                else:
+                    self.result = tuple(message[1:])
+        except (EOFError, OSError):
+            return False
+        return True
+
+    def receive(self, progress=None):
+        """Handles whatever the worker has sent so far. Returns True once the
+        current build is over, one way or the other."""
+        connected = self.drain(progress)
+        if self.result is not None:
+            return True
+        if connected and self.process.is_alive():
+            return False
+        self.process.join()
+        if connected:
+            # It may have said something just before exiting
+            self.drain(progress)
+        self.conn.close()
+        if self.result is None:
+            self.result = (
+                STATUS_FAILED,
+                "The build process crashed (exit code %s)" % self.process.exitcode,
+            )
+        return True
+
+    def terminate(self, status=STATUS_CANCELLED, message="Cancelled"):
+        """Stops the build, killing the process if it won't stop by itself."""
+        self.process.terminate()
+        self.process.join(KILL_GRACE)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+        self.result = (status, message)
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+
+
+class WorkerPool:
+    """Keeps up to `size` idle workers around between builds, so that
+    repeated builds don't have to start Python and import fontmake again.
+    Builds take workers from the pool and give back the ones which are
+    still healthy; workers which were killed are simply replaced. While
+    builds with more jobs than that are running, the pool keeps enough
+    workers for them, and goes back to `size` when they finish."""
+
+    def __init__(self, size=None):
+        self.size = size or default_jobs()
+        self.idle = []
+        # Jobs allowed by the builds running now
+        self.running_jobs = 0
+        self.lock = threading.Lock()
+
+    def capacity(self):
+        return max(self.size, self.running_jobs)
+
+    def begin(self, jobs):
+        """Makes room for a build running up to `jobs` workers at once."""
+        with self.lock:
+            self.running_jobs += jobs
+
+    def end(self, jobs):
+        """Stops the idle workers a finished build no longer needs."""
+        with self.lock:
+            self.running_jobs -= jobs
+            surplus = self.idle[self.capacity() :]
+            del self.idle[self.capacity() :]
+        for worker in surplus:
+            worker.stop()
+
+    def warm(self, count):
+        """Starts workers in the background until `count` are idle."""
+        with self.lock:
+            self.idle = [x for x in self.idle if x.alive()]
+            while len(self.idle) < min(count, self.size):
+                self.idle.append(Worker())
+
+    def acquire(self):
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.alive():
+                    return worker
+        return Worker()
+
+    def release(self, worker):
+        with self.lock:
+            if (
+                worker.alive()
+                and worker.builds < MAX_BUILDS_PER_WORKER
+                and len(self.idle) < self.capacity()
+            ):
+                self.idle.append(worker)
+                return
+        worker.stop()
+
+    def shutdown(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.stop()
+        for worker in idle:
+            worker.process.join(KILL_GRACE)
+
+
+workers = WorkerPool()
+
+
+def fontmake_jobs(designspace_file, tasks, use_cache=False):
+    """Turns a dict of (label, fontmake args) pairs into jobs for run_pool."""
+    return {
+        key: (label, run_fontmake, (designspace_file, args, use_cache))
+        for key, (label, args) in tasks.items()
+    }
+
+
+def run_pool(
+    tasks,
+    jobs,
+    progress=None,
+    cancel=None,
+    timeout=None,
+    after=None,
+    started=None,
+):
+    """Runs build jobs on warm workers, at most `jobs` at a time.
+
+    `tasks` maps an arbitrary key to a (label, function, args) triple, where
+    `function` is a module-level function such as run_fontmake which takes
+    `progress` and `label` keyword arguments and returns (status, message).
+    Yields (key, status, message) tuples as each job finishes. If given,
+    `progress` is called (in this process) with each task's key and its
+    progress events as they arrive.
+
+    Once `cancel` (a threading.Event) is set, running builds are killed and
+    they and any builds which hadn't started yet are reported as
+    STATUS_CANCELLED. A build still running after `timeout` seconds is
+    killed and fails.
+
+    Jobs are started in the order of `tasks`, except that a job listed in
+    `after` (which maps a key to the key of another job) waits until that
+    job has succeeded, and fails without running if it doesn't. `started`,
+    if given, is called with each job's key as it starts."""
+    queued = list(tasks.items())
+    running = []
+    after = after or {}
+    results = {}
+    jobs = max(1, jobs)
+
+    def finished(build):
+        workers.release(build)
+        results[build.key] = build.result[0]
+        return (build.key,) + build.result
+
+    def next_job():
+        """Takes the first queued job which is ready to go, failing any whose
+        prerequisite has failed; returns None if nothing is ready."""
+        for i, (key, task) in enumerate(queued):
+            prerequisite = after.get(key)
+            if prerequisite in tasks and prerequisite not in results:
+                continue
+            del queued[i]
+            if prerequisite in tasks and not succeeded(results[prerequisite]):
+                results[key] = STATUS_FAILED
+                label = tasks[prerequisite][0]
+                return key, None, "Not built because %s failed" % label
+            return key, task, None
+
+    workers.begin(jobs)
+    try:
+        while queued or running:
+            if cancel is not None and cancel.is_set():
+                for build in running:
+                    build.terminate()
+                    yield finished(build)
+                running = []
+                for key, task in queued:
+                    yield key, STATUS_CANCELLED, "Cancelled"
+                return
+            while queued and len(running) < jobs:
+                job = next_job()
+                if job is None:
+                    break
+                key, task, message = job
+                if task is None:
+                    yield key, STATUS_FAILED, message
+                    continue
+                label, function, args = task
+                worker = workers.acquire()
+                worker.submit(key, label, function, args)
+                running.append(worker)
+                if started:
+                    started(key)
+            # Wake up when any worker sends something or exits
+            connection.wait(
+                [x.conn for x in running] + [x.process.sentinel for x in running],
+                timeout=UPDATE_INTERVAL,
+            )
+            for build in list(running):
+                if not build.receive(progress):
+                    if not timeout or time.monotonic() - build.started < timeout:
+                        continue
+                    build.terminate(
+                        STATUS_FAILED, "Timed out after %g seconds" % timeout
+                    )
+                running.remove(build)
+                yield finished(build)
+    finally:
+        # The caller has stopped listening (or something went wrong), so
+        # don't leave orphaned builds behind
+        for build in running:
+            if build.result is None:
+                build.terminate()
+        workers.end(jobs)
+
+
+def run_fontmake_pool(
+    designspace_file,
+    tasks,
+    jobs,
+    use_cache=False,
+    progress=None,
+    cancel=None,
+    timeout=None,
+):
+    """Runs fontmake builds on warm workers, as run_pool. `tasks` maps an
+    arbitrary key to a (label, args) pair."""
+    return run_pool(
+        fontmake_jobs(designspace_file, tasks, use_cache),
+        jobs,
+        progress=progress,
+        cancel=cancel,
+        timeout=timeout,
+    )
+
+
+def run_fontmake_process(
+    designspace_file,
+    fontmake_args,
+    use_cache=False,
+    progress=None,
+    label="",
+    cancel=None,
+    timeout=None,
+):
+    """Like run_fontmake, but on a worker process, so it can be cancelled or
+    timed out as in run_fontmake_pool. `progress`, if given, is called with
+    each progress event."""
+    for key, status, message in run_fontmake_pool(
+        designspace_file,
+        {label: (label, fontmake_args)},
+        1,
+        use_cache=use_cache,
+        progress=progress and (lambda key, event: progress(event)),
+        cancel=cancel,
+        timeout=timeout,
+    ):
+        return status, message
+
+
+def instance_shards(designspace, fontmake_args, jobs):
+    """Splits a static instance build into independent fontmake runs.
+
+    Returns a list of (label, args) pairs. Named instances are spread over
+    at most `jobs` shards, each selected with an `interpolate` regex; masters
+    built as instances get a shard of their own."""
+    shards = []
+    names = [x.name for x in designspace.instances]
+    if fontmake_args.get("masters_as_instances"):
+        args = dict(fontmake_args)
+        args["interpolate"] = False
+        shards.append(("Masters", args))
+
+    if not fontmake_args.get("interpolate") or not names:
+        return shards
+
+    if not all(names):
+        # Unnamed instances can't be selected by regex, so build them together
+        args = dict(fontmake_args)
+        args["masters_as_instances"] = False
+        shards.append(("Instances", args))
+        return shards
+
+    jobs = max(1, min(jobs, len(names)))
+    per_shard = -(-len(names) // jobs)
+    for i in range(0, len(names), per_shard):
+        chunk = names[i : i + per_shard]
+        args = dict(fontmake_args)
+        args["masters_as_instances"] = False
+        args["interpolate"] = "^(?:%s)$" % "|".join(re.escape(x) for x in chunk)
+        shards.append((", ".join(chunk), args))
+    return shards
@@ -0,0 +1,86 @@
+"""Where Pilcrow keeps its caches, and helpers for fingerprinting files.
+
+Nothing here may import Qt: the caches are shared with the command line
+tools and with worker processes."""
+
+import hashlib
+import json
+import os
+import sys
+
+
+def cache_dir(*parts):
+    if sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches/Pilcrow")
+    elif sys.platform == "win32":
+        base = os.path.join(
+            os.environ.get("LOCALAPPDATA", os.path.expanduser("~")), "Pilcrow", "Cache"
+        )
+    else:
+        base = os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pilcrow"
+        )
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def key_for(*things):
+    """A stable hex digest of some JSON-serializable things."""
+    blob = json.dumps(things, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    # Write then rename, so that concurrent readers (other worker processes)
+    # never see a half-written file.
+    tmp = "%s.%i.tmp" % (path, os.getpid())
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class FileHasher:
+    """Hashes file contents, remembering each file's (mtime, size) stamp so
+    that unchanged files don't have to be read again next time."""
+
+    def __init__(self, name):
+        self.path = os.path.join(cache_dir("stamps"), key_for(name) + ".json")
+        self.stamps = read_json(self.path, {})
+        self.dirty = False
+
+    def digest(self, filename):
+        st = os.stat(filename)
+        stamp = [st.st_mtime_ns, st.st_size]
+        cached = self.stamps.get(filename)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+        with open(filename, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self.stamps[filename] = stamp + [digest]
+        self.dirty = True
+        return digest
+
+    def tree_digest(self, path):
+        """A digest of every file below a directory, such as a UFO."""
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                h.update(os.path.relpath(filename, path).encode("utf-8"))
+                h.update(self.digest(filename).encode("ascii"))
+        return h.hexdigest()
+
+    def save(self):
+        if self.dirty:
+            write_json(self.path, self.stamps)
+            self.dirty = False
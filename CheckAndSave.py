@@ -4,35 +4,69 @@ from MyWizardPage import MyWizardPage
 from fontTools.designspaceLib import AxisDescriptor
 from PyQt5.QtCore import Qt, pyqtSlot, QPoint
 from PyQt5 import QtGui
-from fontTools.varLib.interpolatable import test
-from fontTools.ufoLib import UFOReader
+from CompatibilityCheck import (
+    BUDGET,
+    Status,
+    check_batches,
+    clean_problems,
+    default_jobs,
+)
 from os.path import basename, dirname, commonpath
 from waitingspinnerwidget import QtWaitingSpinner
-
-from enum import IntEnum
-
-
-class Status(IntEnum):
-    NONE = -1
-    OK = 0
-    WARN = 1
-    ERROR = 2
+from ProblemsModel import ProblemsModel
+import copy
+import threading
 
 
 class TestRunner(QObject):
+    signalProgress = pyqtSignal(int, int)
+    signalProblems = pyqtSignal(object)
     signalStatus = pyqtSignal(object)
 
-    def __init__(self, glyphsets, names, parent=None):
+    def __init__(self, ufo_paths, names, jobs, previous=None, parent=None):
         super(self.__class__, self).__init__(parent)
-        self.glyphsets = glyphsets
+        self.ufo_paths = ufo_paths
         self.names = names
+        self.jobs = jobs
+        # The threads of the checks this one replaces, which have been
+        # cancelled but may not have stopped yet
+        self.previous = previous or []
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        # Called from the GUI thread; our own thread is busy in start()
+        self.cancelled.set()
 
     @pyqtSlot()
     def start(self):
+        # Never two checks at once: they would only compete for the
+        # processors, and this one can use what those found
+        for thread in self.previous:
+            thread.wait()
+        self.previous = []
+        if self.cancelled.is_set():
+            # Replaced in turn while waiting
+            return
         print("Test called")
-        self.problems = test(self.glyphsets, names=self.names)
+        self.problems = {}
+        for checked, total, problems in check_batches(
+            self.ufo_paths,
+            self.names,
+            jobs=self.jobs,
+            budget=BUDGET,
+            cancel=self.cancelled,
+        ):
+            for glyph, glyph_problems in problems.items():
+                self.problems.setdefault(glyph, []).extend(glyph_problems)
+            self.signalProgress.emit(checked, total)
+            if problems:
+                # The page marks up the problems it's given; these ones
+                # are still being written to the cache
+                self.signalProblems.emit(copy.deepcopy(problems))
+        if self.cancelled.is_set():
+            return
         print("Test done")
-        self.signalStatus.emit(self.problems)
+        self.signalStatus.emit({k: self.problems[k] for k in sorted(self.problems)})
 
 
 class CheckAndSave(MyWizardPage):
@@ -43,27 +77,42 @@ class CheckAndSave(MyWizardPage):
         self.setLayout(self.layout)
         self.parent = parent
         self.status = Status.NONE
+        self.worker = None
+        self.worker_thread = None
+        self.stopped = []
 
     def initializePage(self):
+        self.stopChecking()
         self.clearLayout()
         self.designspace = self.parent.designspace
-        fonts = [UFOReader(x.path) for x in self.designspace.sources]
+        ufo_paths = [x.path for x in self.designspace.sources]
         names = [
             basename(x.filename).rsplit(".", 1)[0] for x in self.designspace.sources
         ]
-        glyphsets = [font.getGlyphSet() for font in fonts]
 
-        self.layout.addWidget(QLabel("Checking for compatibility errors..."))
-        spinner = QtWaitingSpinner(self)
-        self.layout.addWidget(spinner)
+        self.status = Status.NONE
+        self.checking = QLabel("Checking for compatibility errors...")
+        self.layout.addWidget(self.checking)
+        self.spinner = QtWaitingSpinner(self)
+        self.layout.addWidget(self.spinner)
+        self.progress = QProgressBar()
+        self.progress.setFormat("%v of %m glyphs checked")
+        self.progress.setMaximum(0)
+        self.layout.addWidget(self.progress)
+        self.found = Status.OK
+        self.addProblemsTable()
         self.saved = QLabel("Saved")
 
-        self.worker = TestRunner(glyphsets, names)
+        self.worker = TestRunner(
+            ufo_paths, names, default_jobs(), [x[1] for x in self.stopped]
+        )
         self.worker_thread = QThread()
         self.worker.moveToThread(self.worker_thread)
         self.worker_thread.started.connect(self.worker.start)
+        self.worker.signalProgress.connect(self.show_progress)
+        self.worker.signalProblems.connect(self.show_problems)
         self.worker.signalStatus.connect(self.show_results)
-        spinner.start()
+        self.spinner.start()
         self.worker_thread.start()
         self.parent.setButtonLayout(
             [
@@ -79,50 +128,119 @@ class CheckAndSave(MyWizardPage):
         self.parent.button(QWizard.CustomButton1).clicked.connect(self.saveDesignspace)
         self.parent.button(QWizard.CustomButton1).setEnabled(False)
 
+    def stopChecking(self, wait=False):
+        """Cancels the check in progress, if there is one, without reporting
+        on it. Its thread finishes once the batches already being checked are
+        done, unless we `wait` for that here."""
+        if self.worker:
+            self.worker.signalProgress.disconnect()
+            self.worker.signalProblems.disconnect()
+            self.worker.signalStatus.disconnect()
+            self.worker.cancel()
+            self.worker_thread.quit()
+            # Keep them alive until the thread finishes
+            self.stopped.append((self.worker, self.worker_thread))
+        self.worker = None
+        self.worker_thread = None
+        if wait:
+            for worker, stopped_thread in self.stopped:
+                stopped_thread.wait()
+        self.stopped = [x for x in self.stopped if not x[1].isFinished()]
+
+    def cleanupPage(self):
+        self.stopChecking()
+        super().cleanupPage()
+
+    def addProblemsTable(self):
+        self.problemsBox = QWidget()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.problemsBox.setLayout(layout)
+        self.problemsFilter = QLineEdit()
+        self.problemsFilter.setPlaceholderText("Filter by glyph, status or message")
+        self.problemsFilter.setClearButtonEnabled(True)
+        layout.addWidget(self.problemsFilter)
+
+        self.problemsModel = ProblemsModel(self)
+        self.problemsWidget = QTableView()
+        self.problemsWidget.setModel(self.problemsModel)
+        self.problemsWidget.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.problemsWidget.setSortingEnabled(True)
+        self.problemsWidget.horizontalHeader().setStretchLastSection(True)
+        self.problemsWidget.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.problemsWidget.verticalHeader().hide()
+        self.problemsWidget.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.problemsWidget.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        layout.addWidget(self.problemsWidget)
+
+        # Wait for a pause in typing before filtering
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(150)
+        self.filterTimer.timeout.connect(
+            lambda: self.problemsModel.setFilterText(self.problemsFilter.text())
+        )
+        self.problemsFilter.textChanged.connect(self.filterTimer.start)
+        self.problemsBox.hide()
+        self.layout.addWidget(self.problemsBox)
+
+    def show_progress(self, checked, total):
+        if self.sender() is not self.worker:
+            # Already queued when that check was cancelled
+            return
+        self.progress.setMaximum(total)
+        self.progress.setValue(checked)
+
+    def show_problems(self, problems):
+        if self.sender() is not self.worker:
+            # Already queued when that check was cancelled
+            return
+        # Problems are shown as they're found, so that there's something to
+        # look at (and fix) while the rest of the glyphs are checked
+        status = clean_problems(problems)
+        if not problems:
+            return
+        self.problemsModel.addProblems(problems)
+        self.problemsBox.show()
+        if status > self.found:
+            self.found = status
+            if status == Status.ERROR:
+                self.checking.setText(
+                    "There are errors you will need to fix; still checking..."
+                )
+
     def show_results(self, problems):
-        self.clearLayout()
+        if self.sender() is not self.worker:
+            # Already queued when that check was cancelled
+            return
         self.worker_thread.quit()
+        for w in [self.checking, self.spinner, self.progress]:
+            self.layout.removeWidget(w)
+            w.deleteLater()
         self.problems = problems
         self.status = self.cleanProblems()
         if not self.problems:
             labeltext = "Everything looks good! "
             if self.parent.dirty:
               labeltext = labeltext + "Let's save it now..."
-            self.layout.addWidget(QLabel(labeltext))
+            self.layout.insertWidget(0, QLabel(labeltext))
             self.parent.button(QWizard.CustomButton1).setEnabled(True)
 
         else:
             if self.status == Status.WARN:
-                self.layout.addWidget(
-                    QLabel("It'll work, but there were a few warnings")
+                self.layout.insertWidget(
+                    0, QLabel("It'll work, but there were a few warnings")
                 )
             elif self.status == Status.ERROR:
-                self.layout.addWidget(QLabel("There were some errors you need to fix"))
+                self.layout.insertWidget(
+                    0, QLabel("There were some errors you need to fix")
+                )
 
-            self.sourcesScroll = QScrollArea()
-            self.problemsWidget = QTableWidget()
-            self.problemsWidget.setColumnCount(3)
-            self.problemsWidget.setHorizontalHeaderLabels(
-                ["Glyph", "Status", "Message"]
-            )
-            self.sourcesScroll.setSizePolicy(
-                QSizePolicy.Expanding, QSizePolicy.Expanding
-            )
-            self.problemsWidget.horizontalHeader().setStretchLastSection(True)
-            for k in self.problems.keys():
-                for v in self.problems[k]:
-                    rowPosition = self.problemsWidget.rowCount()
-                    self.problemsWidget.insertRow(rowPosition)
-                    self.problemsWidget.setItem(rowPosition, 0, QTableWidgetItem(k))
-                    self.problemsWidget.setItem(
-                        rowPosition, 1, QTableWidgetItem(v["status"])
-                    )
-                    self.problemsWidget.setItem(
-                        rowPosition, 2, QTableWidgetItem(v["message"])
-                    )
-            self.sourcesScroll.setWidget(self.problemsWidget)
-            self.sourcesScroll.setWidgetResizable(True)
-            self.layout.addWidget(self.sourcesScroll)
+            # Now in glyph order, rather than the order they were found in
+            self.problemsModel.clear()
+            self.problemsModel.addProblems(self.problems)
+            self.problemsWidget.resizeColumnToContents(0)
+            self.problemsBox.show()
 
         self.layout.addWidget(self.saved)
         if self.parent.dirty:
@@ -162,79 +280,4 @@ class CheckAndSave(MyWizardPage):
         ) and not self.parent.dirty
 
     def cleanProblems(self):
-        status = Status.OK
-        if not self.problems:
-          return status
-        keys = list(self.problems.keys())
-        for (
-            k
-        ) in (
-            keys
-        ):  # We do this malarkey because we can't alter an OrderDict while iterating
-            newproblems = []
-            for p in self.problems[k]:
-                if p["type"] == "node_count":
-                    status = Status.ERROR
-                    p["status"] = "ERROR"
-                    p[
-                        "message"
-                    ] = "Node count differs in path %i: %i in %s, %i in %s" % (
-                        p["path"],
-                        p["value_1"],
-                        p["master_1"],
-                        p["value_2"],
-                        p["master_2"],
-                    )
-                if p["type"] == "path_count":
-                    status = Status.ERROR
-                    p["status"] = "ERROR"
-                    p["message"] = "Path count differs: %i in %s, %i in %s" % (
-                        p["value_1"],
-                        p["master_1"],
-                        p["value_2"],
-                        p["master_2"],
-                    )
-                if p["type"] == "missing":
-                    status = Status.ERROR
-                    p["status"] = "ERROR"
-                    p["message"] = "Glyph was missing in master %s" % p["master"]
-                if p["type"] == "node_incompatibility":
-                    status = Status.ERROR
-                    p["status"] = "ERROR"
-                    p[
-                        "message"
-                    ] = "Node %o incompatible in path %i: %s in %s, %s in %s" % (
-                        p["node"],
-                        p["path"],
-                        p["value_1"],
-                        p["master_1"],
-                        p["value_2"],
-                        p["master_2"],
-                    )
-                if p["type"] == "contour_order":
-                    status = max(status, Status.WARN)
-                    p["status"] = "WARN"
-                    p["message"] = "Contour order differs: %s in %s, %s in %s" % (
-                        p["value_1"],
-                        p["master_1"],
-                        p["value_2"],
-                        p["master_2"],
-                    )
-                if p["type"] == "high_cost":
-                    continue
-                    # status = max(status, Status.WARN)
-                    # p[
-                    #     "message"
-                    # ] = "Interpolation has high cost: cost of %s to %s = %i, threshold %i" % (
-                    #     p["master_1"],
-                    #     p["master_2"],
-                    #     p["value_1"],
-                    #     p["value_2"],
-                    # )
-
-                newproblems.append(p)
-            if not newproblems:
-                del self.problems[k]
-            else:
-                self.problems[k] = newproblems
-        return status
+        return clean_problems(self.problems)
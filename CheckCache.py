@@ -0,0 +1,124 @@
+"""Remembers the compatibility check's findings for each glyph between runs.
+
+A glyph's result depends on its glif file in every master, the glifs of any
+components it uses, the order and names of the masters, and the version of
+fontTools doing the checking. If none of those have changed since the glyph
+was last checked, the problems found then (usually none) are reused, so that
+going back to fix one glyph only rechecks that glyph."""
+
+import os
+import plistlib
+import re
+
+import fontTools
+
+from Cache import FileHasher, cache_dir, key_for, read_json, write_json
+
+COMPONENT = re.compile(rb"<component\s[^>]*\bbase\s*=\s*[\"']([^\"']+)[\"']")
+
+
+def glif_files(ufo_path):
+    """The glif file for each glyph in a UFO's default layer, or None if
+    the UFO isn't a plain directory (such as a .ufoz)."""
+    glyphs_dir = os.path.join(ufo_path, "glyphs")
+    try:
+        with open(os.path.join(glyphs_dir, "contents.plist"), "rb") as f:
+            contents = plistlib.load(f)
+    except (OSError, ValueError):
+        return None
+    return {name: os.path.join(glyphs_dir, glif) for name, glif in contents.items()}
+
+
+class CheckCache:
+    def __init__(self, ufo_paths, names):
+        self.ufo_paths = [os.path.abspath(x) for x in ufo_paths]
+        self.names = names
+        self.path = os.path.join(
+            cache_dir("checks"), key_for(sorted(self.ufo_paths)) + ".json"
+        )
+        entry = read_json(self.path, {})
+        self.results = entry.get("results", {})
+        self.components = entry.get("components", {})
+        self.hashers = [FileHasher(path) for path in self.ufo_paths]
+        self.files = [glif_files(path) for path in self.ufo_paths]
+        self.keys = {}
+
+    def digest(self, master, glyph):
+        filename = self.files[master].get(glyph)
+        if not filename:
+            return None
+        try:
+            return self.hashers[master].digest(filename)
+        except OSError:
+            return None
+
+    def glyph_components(self, master, glyph, digest):
+        """The names of the components a glif refers to; only read from the
+        file when this version of it hasn't been seen before."""
+        if digest not in self.components:
+            try:
+                with open(self.files[master][glyph], "rb") as f:
+                    bases = COMPONENT.findall(f.read())
+            except OSError:
+                bases = []
+            self.components[digest] = sorted(
+                {x.decode("utf-8", "replace") for x in bases}
+            )
+        return self.components[digest]
+
+    def master_digests(self, master, glyph):
+        """Digests of a glyph and everything it uses in one master."""
+        digests = {}
+        pending = [glyph]
+        while pending:
+            name = pending.pop()
+            if name in digests:
+                continue
+            digest = self.digest(master, name)
+            digests[name] = digest
+            if digest:
+                pending.extend(self.glyph_components(master, name, digest))
+        return digests
+
+    def key(self, glyph):
+        if glyph not in self.keys:
+            if None in self.files:
+                self.keys[glyph] = None
+            else:
+                self.keys[glyph] = key_for(
+                    self.names,
+                    [self.master_digests(i, glyph) for i in range(len(self.files))],
+                    fontTools.version,
+                )
+        return self.keys[glyph]
+
+    def get(self, glyph):
+        """The problems found last time this glyph was checked, or None if
+        it has changed (or never been checked)."""
+        key = self.key(glyph)
+        cached = self.results.get(glyph)
+        if key and cached and cached[0] == key:
+            return cached[1]
+        return None
+
+    def put(self, glyph, problems):
+        key = self.key(glyph)
+        if key:
+            self.results[glyph] = [key, problems]
+
+    def save(self, glyphs):
+        """Writes the results for the glyphs still in the font."""
+        for hasher in self.hashers:
+            hasher.save()
+        if None in self.files:
+            return
+        results = {x: self.results[x] for x in glyphs if x in self.results}
+        used = {key for x in results for key in self.used_digests(x)}
+        components = {k: v for k, v in self.components.items() if k in used}
+        write_json(self.path, {"results": results, "components": components})
+
+    def used_digests(self, glyph):
+        for master in range(len(self.files)):
+            digest = self.digest(master, glyph)
+            if digest:
+                yield digest
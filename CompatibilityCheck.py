@@ -0,0 +1,320 @@
+"""Checks that the masters of a designspace are compatible for interpolation.
+
+fontTools.varLib.interpolatable looks at one glyph at a time, so for large
+fonts the glyph list is split into shards which are checked in parallel on a
+pool of processes, and the problems found are put back together in glyph
+order. With NumPy, structural problems are found first for all the glyphs in
+a batch at once, followed by a rough check of the paths' order, directions
+and starting points (see StructureCheck); interpolatable's slower contour
+matching is only used for the glyphs the rough check isn't sure about. The
+rough check's wrong_start_point problems are its own, marked approximate,
+and may not be the ones interpolatable would find. Glyphs which haven't changed
+since they were last checked aren't checked again (see CheckCache), and the
+outlines are read from a binary cache rather than from the glifs (see
+OutlineCache).
+
+The worker processes import this module to check their shards, as does
+`pilcrow check`, so it mustn't import Qt."""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from enum import IntEnum
+
+from fontTools.varLib.interpolatable import test
+
+from BuildTasks import default_jobs, mp_context
+from CheckCache import CheckCache
+from GlyphIndex import GlyphIndex
+from OutlineCache import glyph_set
+
+try:
+    import numpy
+    from StructureCheck import Outlines, approximate_problems, structural_problems
+
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# Starting the worker processes takes longer than checking this many glyphs
+MIN_PARALLEL_GLYPHS = 250
+
+# Shards per worker, so that one shard full of complicated glyphs doesn't
+# leave the other workers idle at the end
+SHARDS_PER_JOB = 4
+
+# How many glyphs are checked between progress reports, in one process and
+# at most on each worker
+BATCH_SIZE = 50
+MAX_SHARD_SIZE = 200
+
+# The wizard's check page limits how long, on average, interpolatable's
+# contour matching may spend on each glyph in a batch, in seconds, so that it
+# can show what it has found quickly. Glyphs it doesn't get to are reported
+# as unchecked (and checked again next time). Otherwise there is no limit
+BUDGET = 0.05
+
+
+class Status(IntEnum):
+    NONE = -1
+    OK = 0
+    WARN = 1
+    ERROR = 2
+
+
+class MasterGlyphs:
+    """A master's glyph set which gives None for glyphs the master hasn't
+    got, rather than raising KeyError, so that interpolatable reports them
+    as missing."""
+
+    def __init__(self, glyphset):
+        self.glyphset = glyphset
+
+    def keys(self):
+        return self.glyphset.keys()
+
+    def __contains__(self, name):
+        return name in self.glyphset
+
+    def __getitem__(self, name):
+        return self.glyphset[name] if name in self.glyphset else None
+
+
+def open_glyphsets(ufo_paths, update=True, jobs=1):
+    """The masters' glyph sets, read from the outline cache (see
+    OutlineCache); `update` brings the cache up to date first, which the
+    workers leave to the process which started them."""
+    return [
+        MasterGlyphs(glyph_set(path, update=update, jobs=jobs)) for path in ufo_paths
+    ]
+
+
+def batches(glyphs, size):
+    return [glyphs[i : i + size] for i in range(0, len(glyphs), size)]
+
+
+def test_glyphs(glyphsets, glyphs, names, budget=None):
+    """interpolatable.test, with the quicker checks done beforehand if we
+    can; returns a plain dict of glyph name to list of problems. `budget`
+    is in seconds per glyph, or None for no limit."""
+    if not has_numpy:
+        return dict(test(glyphsets, glyphs=glyphs, names=names))
+    outlines = Outlines(glyphsets, glyphs)
+    problems = structural_problems(outlines, names)
+    compatible = [i for i, glyph in enumerate(glyphs) if glyph not in problems]
+    approximate, unsure = approximate_problems(outlines, names, compatible)
+    problems.update(approximate)
+
+    deadline = time.monotonic() + budget * len(glyphs) if budget else None
+    for glyph in unsure:
+        if deadline and time.monotonic() > deadline:
+            problems[glyph] = [{"type": "unchecked"}]
+            continue
+        problems.update(test(outlines.glyphsets, glyphs=[glyph], names=names))
+    return merge(glyphs, [problems])
+
+
+def check_shard(ufo_paths, names, glyphs, budget=None):
+    """Runs on a worker: checks some of the glyphs."""
+    return test_glyphs(open_glyphsets(ufo_paths, update=False), glyphs, names, budget)
+
+
+def merge(glyphs, results):
+    problems = {}
+    for result in results:
+        problems.update(result)
+    return {glyph: problems[glyph] for glyph in glyphs if glyph in problems}
+
+
+def run_test(ufo_paths, names, glyphsets, glyphs, jobs, budget=None):
+    """Checks the glyphs a batch at a time, yielding (glyphs in the batch,
+    their problems) as each batch is done; in parallel, the batches come in
+    whatever order they finish. Closing the generator drops the batches not
+    yet started."""
+    if jobs <= 1 or len(glyphs) < MIN_PARALLEL_GLYPHS:
+        for batch in batches(glyphs, BATCH_SIZE):
+            yield batch, test_glyphs(glyphsets, batch, names, budget)
+        return
+
+    size = min(-(-len(glyphs) // (jobs * SHARDS_PER_JOB)), MAX_SHARD_SIZE)
+    work = batches(glyphs, size)
+    pool = ProcessPoolExecutor(max_workers=min(jobs, len(work)), mp_context=mp_context)
+    try:
+        futures = {
+            pool.submit(check_shard, ufo_paths, names, shard, budget): shard
+            for shard in work
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Shards already being checked are finished (there's no stopping
+        # them part way); the rest are dropped
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def check_batches(
+    ufo_paths, names, jobs=None, use_cache=True, budget=None, cancel=None
+):
+    """Checks the masters at `ufo_paths` (called `names` in the problem
+    reports) on up to `jobs` processes, yielding (glyphs checked so far,
+    total glyphs, problems) as the checking goes on. Each `problems` is a
+    dict of glyph name to list of problems, in the form interpolatable.test
+    returns them, for the glyphs checked since the last yield. Glyphs which
+    the masters' glyph lists show to be missing from some masters are
+    reported as missing in the first yield; any other problems they have
+    come later.
+
+    With `use_cache`, only glyphs which have changed since the last check
+    of these masters are tested; the problems remembered for the others
+    come first. `budget` limits the time spent on thorough checks of
+    contour order and starting points, in seconds per glyph; None means no
+    limit.
+
+    Once `cancel` (a threading.Event) is set, the check stops after the
+    batches already started, and yields nothing more; what was found so far
+    is still remembered, so the next check carries on from there."""
+    jobs = jobs or default_jobs()
+    glyphsets = open_glyphsets(ufo_paths, jobs=jobs)
+    index = GlyphIndex(ufo_paths)
+    glyphs = index.names()
+    cache = CheckCache(ufo_paths, names) if use_cache else None
+    known = {}
+    stale = []
+    # Glyphs whose missing problems are reported before they're checked
+    reported = set()
+    for glyph in glyphs:
+        problems = cache.get(glyph) if cache else None
+        if problems is not None:
+            if problems:
+                known[glyph] = problems
+            continue
+        missing = index.masters_missing(glyph)
+        if len(missing) >= len(ufo_paths) - 1:
+            # Nothing to compare it with, so interpolatable ignores it
+            continue
+        if missing:
+            known[glyph] = [
+                {"type": "missing", "master": names[m], "master_idx": m}
+                for m in missing
+            ]
+            reported.add(glyph)
+        stale.append(glyph)
+    print("Checking %i of %i glyphs" % (len(stale), len(glyphs)))
+
+    checked = len(glyphs) - len(stale)
+    results = run_test(ufo_paths, names, glyphsets, stale, jobs, budget)
+    try:
+        yield checked, len(glyphs), known
+        for batch, problems in results:
+            if cache:
+                for glyph in batch:
+                    found = problems.get(glyph, [])
+                    # Glyphs we ran out of time for are tried again next time
+                    if not any(p["type"] == "unchecked" for p in found):
+                        cache.put(glyph, found)
+            if cancel is not None and cancel.is_set():
+                print("Check cancelled")
+                return
+            checked += len(batch)
+            found = merge(batch, [problems])
+            for glyph in reported.intersection(found):
+                found[glyph] = [p for p in found[glyph] if p["type"] != "missing"]
+                if not found[glyph]:
+                    del found[glyph]
+            yield checked, len(glyphs), found
+    finally:
+        # Stops the workers now, rather than whenever this is collected
+        results.close()
+        # Keep what was found even if the check didn't finish
+        if cache:
+            cache.save(glyphs)
+
+
+def check(ufo_paths, names, jobs=None, use_cache=True, budget=None):
+    """Checks everything at once; returns a dict of glyph name to list of
+    problems, in glyph order. The arguments are as for check_batches."""
+    problems = {}
+    for checked, total, found in check_batches(
+        ufo_paths, names, jobs=jobs, use_cache=use_cache, budget=budget
+    ):
+        for glyph, glyph_problems in found.items():
+            problems.setdefault(glyph, []).extend(glyph_problems)
+    return {glyph: problems[glyph] for glyph in sorted(problems)}
+
+
+def describe(p):
+    """The status and message to show for a problem, or None for problems
+    we don't report."""
+    if p["type"] == "node_count":
+        return Status.ERROR, "Node count differs in path %i: %i in %s, %i in %s" % (
+            p["path"],
+            p["value_1"],
+            p["master_1"],
+            p["value_2"],
+            p["master_2"],
+        )
+    if p["type"] == "path_count":
+        return Status.ERROR, "Path count differs: %i in %s, %i in %s" % (
+            p["value_1"],
+            p["master_1"],
+            p["value_2"],
+            p["master_2"],
+        )
+    if p["type"] == "missing":
+        return Status.ERROR, "Glyph was missing in master %s" % p["master"]
+    if p["type"] == "node_incompatibility":
+        return (
+            Status.ERROR,
+            "Node %o incompatible in path %i: %s in %s, %s in %s"
+            % (
+                p["node"],
+                p["path"],
+                p["value_1"],
+                p["master_1"],
+                p["value_2"],
+                p["master_2"],
+            ),
+        )
+    if p["type"] == "contour_order":
+        return Status.WARN, "Contour order differs: %s in %s, %s in %s" % (
+            p["value_1"],
+            p["master_1"],
+            p["value_2"],
+            p["master_2"],
+        )
+    if p["type"] == "wrong_start_point":
+        if p.get("reversed"):
+            message = "Contour %i is drawn the other way round in %s compared to %s"
+        else:
+            message = "Contour %i starts at a different point in %s compared to %s"
+        return Status.WARN, message % (p["contour"], p["master_2"], p["master_1"])
+    if p["type"] == "unchecked":
+        return (
+            Status.WARN,
+            "Contour order and starting points weren't checked (it took too long)",
+        )
+    # high_cost, and the newer checks (kinks, weights) which mostly point
+    # out things that will interpolate anyway
+    return None
+
+
+def clean_problems(problems):
+    """Gives each problem in a dict of glyph name to problems a "status"
+    ("WARN" or "ERROR") and a "message", and drops the problems we don't
+    report and then any glyphs left with none. Returns the overall Status."""
+    status = Status.OK
+    # Not iterating over the dict itself, because we remove things from it
+    for glyph in list(problems.keys()):
+        kept = []
+        for p in problems[glyph]:
+            described = describe(p)
+            if not described:
+                continue
+            p["status"] = described[0].name
+            p["message"] = described[1]
+            status = max(status, described[0])
+            kept.append(p)
+        if kept:
+            problems[glyph] = kept
+        else:
+            del problems[glyph]
+    return status
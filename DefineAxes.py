@@ -1,6 +1,5 @@
 from PyQt5.QtWidgets import *
 from MyWizardPage import MyWizardPage
-from MapEditor import MapEditor
 from fontTools.designspaceLib import AxisDescriptor
 from PyQt5.QtCore import Qt, pyqtSlot, QRegularExpression
 from PyQt5 import QtGui
@@ -243,6 +242,8 @@ class DefineAxes(MyWizardPage):
 
   @pyqtSlot()
   def showMap(self):
+    # The map editor's graph needs matplotlib, which is slow to import
+    from MapEditor import MapEditor
     axis = self.designspace.axes[self.sender().ix]
     MapEditor(self, axis).exec_()
 
@@ -120,7 +120,7 @@ class DefineInstances(MyWizardPage):
     self.designspace = self.parent.designspace
     self.right.setParent(None)
     self.right.deleteLater()
-    self.right = DesignSpaceVisualizer(self.designspace, draw_glyph="e")
+    self.right = DesignSpaceVisualizer(self.designspace, draw_glyph="e", draw_instances=True)
     self.splitter.addWidget(self.right)
     width = qApp.desktop().availableGeometry(self).width()
     self.splitter.setSizes([width * 2/3, width * 1/3])
@@ -156,7 +156,7 @@ class DefineInstances(MyWizardPage):
     if not instance.location:
       instance.location = {}
     instance.location[loc.name] = loc.value()
-    self.right.refresh()
+    self.right.updateLocations()
     self.completeChanged.emit()
 
   @pyqtSlot()
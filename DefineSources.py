@@ -5,7 +5,14 @@ from PyQt5.QtCore import Qt, pyqtSlot, QPoint, pyqtSignal
 from PyQt5 import QtGui
 import re, os
 from QDesignSpace import DesignSpaceVisualizer
-import defcon
+from GlyphIndex import GlyphIndex
+from fontTools.ufoLib import UFOReader
+
+
+class FontInfo:
+  """Somewhere for UFOReader.readInfo to put a source's font info."""
+  familyName = None
+  styleName = None
 
 
 class DragDropArea(QPushButton):
@@ -126,11 +133,13 @@ class DefineSources(MyWizardPage):
   def setNames(self, source):
     if source.familyName and source.styleName:
       return
-    self.designspace.loadSourceFonts(defcon.Font)
+    # Just the font info, rather than loading the whole source
+    info = FontInfo()
+    UFOReader(source.path, validate=False).readInfo(info)
     if not source.familyName:
-      source.familyName = source.font.info.familyName
+      source.familyName = info.familyName
     if not source.styleName:
-      source.styleName = source.font.info.styleName
+      source.styleName = info.styleName
 
   @pyqtSlot()
   def addSource(self):
@@ -167,7 +176,7 @@ class DefineSources(MyWizardPage):
     if not source.location:
       source.location = {}
     source.location[loc.name] = loc.value()
-    self.right.refresh()
+    self.right.updateLocations()
 
   def setupSources(self):
     self._clearLayout(self.sourcesLayout)
@@ -176,7 +185,15 @@ class DefineSources(MyWizardPage):
       axlabel = QLabel(ax.name)
       axlabel.setToolTip("<i>%s</i> value for this source in designspace coordinates" % ax.tag)
       self.sourcesLayout.addWidget(axlabel, 0, 1+ix)
-    self.sourcesLayout.addWidget(QLabel("Remove"), 0, 1+len(self.designspace.axes))
+    glyphsLabel = QLabel("Glyphs")
+    glyphsLabel.setToolTip("Glyphs in this source, and how it differs from the others")
+    self.sourcesLayout.addWidget(glyphsLabel, 0, 1+len(self.designspace.axes))
+    self.sourcesLayout.addWidget(QLabel("Remove"), 0, 2+len(self.designspace.axes))
+
+    # Only reads each source's list of glyphs, so this is quick enough to
+    # redo whenever the sources change
+    index = GlyphIndex([x.path for x in self.designspace.sources])
+    differences = index.differences()
 
     for ix,source in enumerate(self.designspace.sources):
       if not source.location:
@@ -211,10 +228,38 @@ class DefineSources(MyWizardPage):
         loc.valueChanged.connect(self.locationChanged)
         self.sourcesLayout.addWidget(loc, ix+1, col+1)
 
+      missing, extra = differences[ix]
+      self.sourcesLayout.addWidget(self.glyphsLabel(index.glyphs[ix], missing, extra), ix+1, len(self.designspace.axes)+1)
+
       removeButton = QPushButton("Remove")
       removeButton.ix = ix
       removeButton.clicked.connect(self.removeRow)
-      self.sourcesLayout.addWidget(removeButton, ix+1, len(self.designspace.axes)+1)
+      self.sourcesLayout.addWidget(removeButton, ix+1, len(self.designspace.axes)+2)
+
+  def glyphsLabel(self, glyphs, missing, extra):
+    text = "%i" % len(glyphs)
+    tooltip = []
+    if missing:
+      text = text + ", %i missing" % len(missing)
+      tooltip.append("<b>Missing:</b> " + self.glyphList(missing))
+    if extra:
+      text = text + ", %i only here" % len(extra)
+      tooltip.append("<b>Only in this source:</b> " + self.glyphList(extra))
+    label = QLabel(text)
+    if missing:
+      # Usually a mistake, though the check only complains about glyphs
+      # which at least two masters have
+      label.setStyleSheet("color: #B00020")
+    if tooltip:
+      label.setToolTip("<br>".join(tooltip))
+    label.setWordWrap(True)
+    return label
+
+  def glyphList(self, glyphs, limit=30):
+    shown = ", ".join(glyphs[:limit])
+    if len(glyphs) > limit:
+      shown = shown + " and %i more" % (len(glyphs) - limit)
+    return shown
 
 
   def isComplete(self):
@@ -0,0 +1,64 @@
+"""Which glyphs each source has, read from the UFOs' contents.plist files.
+
+Reading one plist per source is quick enough to do whenever the sources
+change, so glyphs missing from some masters can be pointed out long before
+the compatibility check gets to them, and the check needn't find them again.
+The headless check uses the index too, so there's no Qt here."""
+
+import os
+
+from CheckCache import glif_files
+
+# (path, contents.plist mtime and size) -> glyph names
+_known = {}
+
+
+def source_glyphs(ufo_path):
+    """The names of the glyphs in a UFO's default layer."""
+    ufo_path = os.path.abspath(ufo_path)
+    try:
+        st = os.stat(os.path.join(ufo_path, "glyphs", "contents.plist"))
+        stamp = (ufo_path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        # Not a plain directory (a .ufoz, say)
+        stamp = None
+    if stamp and stamp in _known:
+        return _known[stamp]
+
+    files = glif_files(ufo_path)
+    if files is None:
+        from fontTools.ufoLib import UFOReader
+
+        names = frozenset(UFOReader(ufo_path).getGlyphSet().keys())
+    else:
+        names = frozenset(files)
+    if stamp:
+        _known[stamp] = names
+    return names
+
+
+class GlyphIndex:
+    """The glyph names of each of a set of masters."""
+
+    def __init__(self, ufo_paths):
+        self.glyphs = [source_glyphs(path) for path in ufo_paths]
+
+    def names(self):
+        """Every glyph in any of the masters, in a stable order."""
+        return sorted(frozenset().union(*self.glyphs))
+
+    def masters_missing(self, glyph):
+        """The indexes of the masters which haven't got the glyph."""
+        return [i for i, names in enumerate(self.glyphs) if glyph not in names]
+
+    def differences(self):
+        """For each master, (glyphs it is missing which other masters have,
+        glyphs no other master has), both sorted."""
+        if len(self.glyphs) < 2:
+            return [([], []) for names in self.glyphs]
+        everything = frozenset().union(*self.glyphs)
+        differences = []
+        for i, names in enumerate(self.glyphs):
+            others = frozenset().union(*(self.glyphs[:i] + self.glyphs[i + 1 :]))
+            differences.append((sorted(everything - names), sorted(names - others)))
+        return differences
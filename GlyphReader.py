@@ -0,0 +1,119 @@
+"""Reads single glyphs from the sources, for the designspace previews.
+
+Drawing the sample glyph only needs that glyph and the glyphs it uses as
+components, so rather than loading each source whole, or bringing its whole
+outline cache up to date first (see OutlineCache), each glyph is read from
+its glif when it is asked for. The glyphs read most recently are kept, up to
+MAX_GLYPHS for each source, and read again only when their glifs change, so
+the memory the previews use doesn't grow with the size of the family."""
+
+import os
+from collections import OrderedDict
+
+from fontTools.ufoLib import UFOReader
+
+from OutlineCache import CachedGlyph, GlyphPacker
+
+# Glyphs kept for each source
+MAX_GLYPHS = 32
+
+# UFO path -> GlyphReader, kept between previews
+_readers = {}
+
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        # Not a plain directory (a .ufoz, say)
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class GlyphReader:
+    """One source's glyphs, read as they are asked for. Use like an
+    OutlineCache: `keys()`, `in`, `[name]` (which gives a CachedGlyph) and
+    `digest(name)`, or `digests(name)` to include its components."""
+
+    def __init__(self, ufo_path):
+        self.ufo_path = ufo_path
+        self.glyphset = None
+        self.stamp = None
+        # glyph name -> (glif stamp, CachedGlyph), least recently used first
+        self.glyphs = OrderedDict()
+        self.refresh()
+
+    def refresh(self):
+        """Rereads the list of glyphs if it has changed."""
+        stamp = file_stamp(os.path.join(self.ufo_path, "glyphs", "contents.plist"))
+        if self.glyphset is not None and stamp is not None and stamp == self.stamp:
+            return
+        self.glyphset = UFOReader(self.ufo_path, validate=False).getGlyphSet()
+        self.stamp = stamp
+        if stamp is None:
+            # No stamps to tell whether a glyph has changed, so start again
+            self.glyphs.clear()
+
+    def glif_stamp(self, name):
+        if self.stamp is None:
+            return None
+        return file_stamp(
+            os.path.join(self.ufo_path, "glyphs", self.glyphset.contents[name])
+        )
+
+    def keys(self):
+        return self.glyphset.keys()
+
+    def __contains__(self, name):
+        return name in self.glyphset
+
+    def __len__(self):
+        return len(self.glyphset)
+
+    def __getitem__(self, name):
+        stamp = self.glif_stamp(name)
+        entry = self.glyphs.pop(name, None)
+        if entry is None or entry[0] != stamp:
+            packer = GlyphPacker()
+            self.glyphset.readGlyph(name, packer, packer)
+            entry = (stamp, CachedGlyph(name, memoryview(packer.pack())))
+        self.glyphs[name] = entry
+        while len(self.glyphs) > MAX_GLYPHS:
+            self.glyphs.popitem(last=False)
+        return entry[1]
+
+    def digest(self, name):
+        """Identifies this version of the glyph's glif, or None if we can't
+        tell."""
+        stamp = self.glif_stamp(name)
+        return stamp and "%i-%i" % stamp
+
+    def digests(self, name):
+        """The digests of a glyph and of every glyph it uses as a component
+        (None for those it hasn't got), as CheckCache keys its results; or
+        None if we can't tell whether any of them has changed."""
+        digests = {}
+        pending = [name]
+        while pending:
+            glyph = pending.pop()
+            if glyph in digests:
+                continue
+            if glyph not in self:
+                digests[glyph] = None
+                continue
+            digests[glyph] = self.digest(glyph)
+            if not digests[glyph]:
+                return None
+            pending.extend(base for base, transformation in self[glyph].components)
+        return digests
+
+
+def glyph_reader(ufo_path):
+    """The GlyphReader for a source, brought up to date."""
+    ufo_path = os.path.abspath(ufo_path)
+    reader = _readers.get(ufo_path)
+    if reader is None:
+        reader = _readers[ufo_path] = GlyphReader(ufo_path)
+    else:
+        reader.refresh()
+    return reader
@@ -0,0 +1,430 @@
+"""Command-line interface to Pilcrow, for building fonts without the wizard.
+
+    python3 pilcrow.py build MyFont.designspace --ttf --variable --jobs 8
+    python3 pilcrow.py check MyFont.designspace --format junit > check.xml
+
+Nothing here may import PyQt5 or matplotlib, so that build farms don't pay
+for starting up the GUI.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+from fontTools.designspaceLib import DesignSpaceDocument
+from BuildTasks import (
+    BuildOptions,
+    can_instantiate_variable_font,
+    default_jobs,
+    has_ttfautohint,
+    succeeded,
+    STATUS_UP_TO_DATE,
+    workers,
+)
+from BuildProgress import format_timings
+from BuildQueue import BuildQueue
+from CompatibilityCheck import (
+    Status,
+    check,
+    clean_problems,
+)
+from GlyphIndex import GlyphIndex
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pilcrow")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build fonts from designspace files")
+    build.add_argument("designspace", nargs="+", help="Designspace file(s) to build")
+    build.add_argument("--variable", action="store_true", help="Create a variable font")
+    build.add_argument(
+        "--ttf", action="store_true", help="Create TrueType static instances"
+    )
+    build.add_argument("--otf", action="store_true", help="Create CFF static instances")
+    build.add_argument(
+        "--from-variable",
+        dest="instances_from_variable",
+        action="store_true",
+        help="Make TrueType instances from the variable font (faster)",
+    )
+    build.add_argument(
+        "--masters-as-instances",
+        action="store_true",
+        help="Output masters as static instances",
+    )
+    build.add_argument("--autohint", action="store_true", help="Run ttfautohint")
+    build.add_argument(
+        "--no-production-names",
+        dest="production_names",
+        action="store_false",
+        help="Keep the source glyph names",
+    )
+    build.add_argument(
+        "--keep-overlaps",
+        dest="remove_overlaps",
+        action="store_false",
+        help="Don't remove overlaps",
+    )
+    build.add_argument(
+        "--mutatormath",
+        action="store_true",
+        help="Use MutatorMath to generate instances",
+    )
+    build.add_argument(
+        "--no-round-instances",
+        dest="round_instances",
+        action="store_false",
+        help="Don't round instances to integers when interpolating",
+    )
+    build.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="Rebuild everything, even fonts whose sources haven't changed",
+    )
+    build.add_argument(
+        "--timings",
+        action="store_true",
+        help="Report how long each stage of each build took",
+    )
+    build.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Give up on any build which takes longer than this",
+    )
+    build.add_argument(
+        "--format",
+        choices=["text", "json"],
+        default="text",
+        help="How to report what was built (default: %(default)s)",
+    )
+    build.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=default_jobs(),
+        help="Number of builds to run at once (default: %(default)s)",
+    )
+
+    check = commands.add_parser(
+        "check", help="Check that the masters of designspace files are compatible"
+    )
+    check.add_argument("designspace", nargs="+", help="Designspace file(s) to check")
+    check.add_argument(
+        "--format",
+        choices=["text", "json", "junit"],
+        default="text",
+        help="How to report the problems found (default: %(default)s)",
+    )
+    check.add_argument(
+        "-o", "--output", metavar="FILE", help="Write the report here, not to stdout"
+    )
+    check.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="Check every glyph, even those which haven't changed since last time",
+    )
+    check.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=default_jobs(),
+        help="Number of processes to check with (default: %(default)s)",
+    )
+    return parser
+
+
+def options_from_args(args, designspace):
+    variable = args.variable
+    if not (args.variable or args.ttf or args.otf):
+        # Same as the build page's defaults
+        variable = True
+    return BuildOptions(
+        autohint=args.autohint,
+        production_names=args.production_names,
+        remove_overlaps=args.remove_overlaps,
+        variable=variable,
+        output_instances=bool((args.ttf or args.otf) and designspace.instances),
+        masters_as_instances=args.masters_as_instances,
+        use_mutatormath=args.mutatormath,
+        round_instances=args.round_instances,
+        instance_ttfs=args.ttf or not args.otf,
+        instance_otfs=args.otf,
+        jobs=max(1, args.jobs),
+        use_cache=args.use_cache,
+        instances_from_variable=args.instances_from_variable
+        and can_instantiate_variable_font(designspace),
+    )
+
+
+def outcome(status):
+    if not succeeded(status):
+        return "failed"
+    if status == STATUS_UP_TO_DATE:
+        return "up to date"
+    return "built"
+
+
+def report(designspace_file, label, status, message):
+    if not succeeded(status):
+        print("%s: %s failed: %s" % (designspace_file, label, message), file=sys.stderr)
+    else:
+        print("%s: %s %s" % (designspace_file, label, outcome(status)))
+
+
+def print_timings(designspace_file, event):
+    if event["stage"] != "done":
+        return
+    label = event["task"] or "Build"
+    print("%s: %s timings:" % (designspace_file, label))
+    for line in format_timings(event["timings"]).splitlines():
+        print("    " + line)
+
+
+def json_build_report(results):
+    return (
+        json.dumps(
+            {
+                designspace_file: {
+                    "status": "failed"
+                    if any(t["status"] == "failed" for t in tasks)
+                    else "ok",
+                    "tasks": tasks,
+                }
+                for designspace_file, tasks in results.items()
+            },
+            indent=2,
+        )
+        + "\n"
+    )
+
+
+def queue_builds(designspace_files, args):
+    """A BuildQueue of everything asked for from all the designspaces."""
+    queue = BuildQueue()
+    for designspace_file in designspace_files:
+        designspace = DesignSpaceDocument.fromfile(designspace_file)
+        queue.add(designspace_file, options_from_args(args, designspace), designspace)
+    return queue
+
+
+def build_all(queue, args):
+    """Builds everything in the queue together, on one pool of --jobs
+    workers; returns each designspace's tasks, as
+    {"task", "status", "message"} dicts (plus "timings" with --timings)."""
+    results = {}
+    timings = {}
+    progress = None
+    if args.timings:
+
+        def progress(key, event):
+            if args.format == "json":
+                if event["stage"] == "done":
+                    timings[key] = event["timings"]
+            else:
+                print_timings(queue.task(key)[0].designspace_file, event)
+
+    for key, status, message in queue.run(
+        max(1, args.jobs), progress=progress, timeout=args.timeout
+    ):
+        entry, label, expected = queue.task(key)
+        if args.format == "text":
+            report(entry.designspace_file, label, status, message)
+        result = {"task": label, "status": outcome(status), "message": message}
+        if key in timings:
+            result["timings"] = timings.pop(key)
+        results.setdefault(entry.designspace_file, []).append(result)
+    return results
+
+
+def build(args):
+    if args.autohint and not has_ttfautohint:
+        print("pilcrow: --autohint needs the ttfautohint executable", file=sys.stderr)
+        return EXIT_USAGE
+    designspace_files = [os.path.abspath(x) for x in args.designspace]
+    missing = [x for x in designspace_files if not os.path.isfile(x)]
+    if missing:
+        for x in missing:
+            print("pilcrow: %s: no such file" % x, file=sys.stderr)
+        return EXIT_USAGE
+
+    queue = queue_builds(designspace_files, args)
+    tasks, after = queue.plan()
+    if not tasks:
+        # --ttf or --otf without any instances, say; a CI job shouldn't
+        # pass without building any fonts
+        print(
+            "pilcrow: nothing to build (no instances; use --masters-as-instances"
+            " or --variable)",
+            file=sys.stderr,
+        )
+        return EXIT_USAGE
+
+    # With --format json, stdout carries nothing but the report
+    quiet = contextlib.nullcontext()
+    if args.format == "json":
+        quiet = contextlib.redirect_stdout(sys.stderr)
+    try:
+        with quiet:
+            results = build_all(queue, args)
+    except KeyboardInterrupt:
+        # Any build processes have been killed on the way out
+        print("pilcrow: interrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    finally:
+        workers.shutdown()
+    if args.format == "json":
+        sys.stdout.write(json_build_report(results))
+    failed = [
+        designspace_file
+        for designspace_file, tasks in results.items()
+        if any(t["status"] == "failed" for t in tasks)
+    ]
+    if failed:
+        print(
+            "%i of %i designspaces failed to build"
+            % (len(failed), len(designspace_files)),
+            file=sys.stderr,
+        )
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def check_designspace(designspace_file, args):
+    """Checks one designspace as the wizard's check page does; returns
+    (overall Status, every glyph name, problems by glyph), with the
+    problems marked up by clean_problems."""
+    designspace = DesignSpaceDocument.fromfile(designspace_file)
+    ufo_paths = [x.path for x in designspace.sources]
+    names = [
+        os.path.basename(x.filename).rsplit(".", 1)[0] for x in designspace.sources
+    ]
+    problems = check(ufo_paths, names, jobs=max(1, args.jobs), use_cache=args.use_cache)
+    status = clean_problems(problems)
+    glyphs = GlyphIndex(ufo_paths).names()
+    return status, glyphs, problems
+
+
+def text_report(results):
+    lines = []
+    for designspace_file, (status, glyphs, problems) in results.items():
+        for glyph, glyph_problems in problems.items():
+            for p in glyph_problems:
+                lines.append(
+                    "%s: %s: %s: %s"
+                    % (designspace_file, glyph, p["status"], p["message"])
+                )
+        lines.append(
+            "%s: %i glyphs checked, %s" % (designspace_file, len(glyphs), status.name)
+        )
+    return "\n".join(lines) + "\n"
+
+
+def json_report(results):
+    return (
+        json.dumps(
+            {
+                designspace_file: {
+                    "status": status.name,
+                    "glyphs": len(glyphs),
+                    "problems": problems,
+                }
+                for designspace_file, (status, glyphs, problems) in results.items()
+            },
+            indent=2,
+        )
+        + "\n"
+    )
+
+
+def junit_report(results):
+    """One test suite per designspace and one test case per glyph, which
+    fails if the glyph has errors; warnings go in the case's output."""
+    suites = ET.Element("testsuites", name="pilcrow check")
+    for designspace_file, (status, glyphs, problems) in results.items():
+        errors = {
+            glyph
+            for glyph, glyph_problems in problems.items()
+            if any(p["status"] == Status.ERROR.name for p in glyph_problems)
+        }
+        suite = ET.SubElement(
+            suites,
+            "testsuite",
+            name=designspace_file,
+            tests=str(len(glyphs)),
+            failures=str(len(errors)),
+            errors="0",
+        )
+        classname = os.path.basename(designspace_file)
+        for glyph in glyphs:
+            case = ET.SubElement(suite, "testcase", classname=classname, name=glyph)
+            glyph_problems = problems.get(glyph, [])
+            for p in glyph_problems:
+                if p["status"] == Status.ERROR.name:
+                    failure = ET.SubElement(
+                        case, "failure", type=p["type"], message=p["message"]
+                    )
+                    failure.text = p["message"]
+            warnings = [
+                p["message"] for p in glyph_problems if p["status"] == Status.WARN.name
+            ]
+            if warnings:
+                ET.SubElement(case, "system-out").text = "\n".join(warnings)
+    ET.indent(suites)
+    return ET.tostring(suites, encoding="unicode", xml_declaration=True) + "\n"
+
+
+REPORTS = {"text": text_report, "json": json_report, "junit": junit_report}
+
+
+def check_all(args):
+    designspace_files = [os.path.abspath(x) for x in args.designspace]
+    missing = [x for x in designspace_files if not os.path.isfile(x)]
+    if missing:
+        for x in missing:
+            print("pilcrow: %s: no such file" % x, file=sys.stderr)
+        return EXIT_USAGE
+
+    results = {}
+    try:
+        # The checker's progress messages would get mixed up with the report
+        with contextlib.redirect_stdout(sys.stderr):
+            for designspace_file in designspace_files:
+                results[designspace_file] = check_designspace(designspace_file, args)
+    except KeyboardInterrupt:
+        print("pilcrow: interrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
+
+    report = REPORTS[args.format](results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report)
+    if any(status == Status.ERROR for status, glyphs, problems in results.values()):
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "build":
+        return build(args)
+    if args.command == "check":
+        return check_all(args)
+    return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Interpolates a glyph between the masters, to show what the instances will
+look like without building anything.
+
+Each master's glyph (with its components decomposed) is flattened into one
+NumPy array of point coordinates and advance width, and the VariationModel's
+deltas between the masters are worked out once. The outline at any location
+is then the model's scalars for that location dotted with the deltas, which
+is quick enough to do each time an instance's location changes."""
+
+from fontTools.misc.transform import Transform
+from fontTools.pens.pointPen import PointToSegmentPen
+from fontTools.varLib.models import (
+    VariationModel,
+    VariationModelError,
+    normalizeLocation,
+)
+
+from OutlineCache import POINT_TYPES, SMOOTH
+
+try:
+    import numpy
+
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# Components nested deeper than this are taken to be a loop
+MAX_NESTING = 10
+
+
+class FlatGlyph:
+    """A glyph's outline with its components decomposed: the point
+    coordinates, each point's type (as OutlineCache stores them) and where
+    each contour ends."""
+
+    def __init__(self, glyphset, glyph):
+        self.width = glyph.width
+        self.coordinates = []
+        self.types = []
+        self.contour_ends = []
+        self.add(glyphset, glyph, Transform(), 0)
+
+    def add(self, glyphset, glyph, transform, depth):
+        if depth > MAX_NESTING:
+            raise ValueError("Components of %s nest too deeply" % glyph.name)
+        start = 0
+        for end in glyph.contour_ends:
+            for i in range(start, end):
+                self.coordinates.extend(
+                    transform.transformPoint(
+                        (glyph.coordinates[2 * i], glyph.coordinates[2 * i + 1])
+                    )
+                )
+                self.types.append(glyph.types[i])
+            self.contour_ends.append(len(self.types))
+            start = end
+        for base, transformation in glyph.components:
+            if base not in glyphset:
+                continue
+            self.add(
+                glyphset,
+                glyphset[base],
+                transform.transform(transformation),
+                depth + 1,
+            )
+
+    def structure(self):
+        """What has to be the same in each master for the glyph to
+        interpolate; points may be smooth in some masters and not others."""
+        return tuple(self.contour_ends), bytes(t & ~SMOOTH for t in self.types)
+
+
+class InterpolatedGlyph:
+    """An outline made by the Interpolator, which draws like a CachedGlyph
+    (see OutlineCache)."""
+
+    def __init__(self, flat, values):
+        self.name = None
+        self.contour_ends = flat.contour_ends
+        self.types = flat.types
+        self.coordinates = values[:-1]
+        self.width = values[-1]
+        self.components = []
+
+    def drawPoints(self, pointPen):
+        start = 0
+        for end in self.contour_ends:
+            pointPen.beginPath()
+            for i in range(start, end):
+                pointPen.addPoint(
+                    (self.coordinates[2 * i], self.coordinates[2 * i + 1]),
+                    segmentType=POINT_TYPES[self.types[i] & ~SMOOTH],
+                    smooth=bool(self.types[i] & SMOOTH),
+                )
+            pointPen.endPath()
+            start = end
+
+    def draw(self, pen, outputImpliedClosingLine=False):
+        self.drawPoints(
+            PointToSegmentPen(pen, outputImpliedClosingLine=outputImpliedClosingLine)
+        )
+
+
+class Interpolator:
+    """Interpolates one glyph between the sources of a designspace.
+    `glyphsets` maps each source's path to its glyph set (see OutlineCache).
+    The masters used are the default source and the others whose glyph is
+    compatible with it; `available` is False if there aren't any, and then
+    `at` gives None."""
+
+    def __init__(self, designspace, glyph, glyphsets):
+        self.available = False
+        if not has_numpy or not designspace.axes:
+            return
+        self.axes = {
+            axis.name: (
+                axis.map_forward(axis.minimum),
+                axis.map_forward(axis.default),
+                axis.map_forward(axis.maximum),
+            )
+            for axis in designspace.axes
+        }
+        masters = []
+        for source in designspace.sources:
+            glyphset = glyphsets.get(source.path)
+            if glyphset is None or glyph not in glyphset:
+                continue
+            try:
+                flat = FlatGlyph(glyphset, glyphset[glyph])
+            except ValueError as e:
+                print(e)
+                continue
+            masters.append((self.normalize(source.location), flat))
+
+        default = [flat for location, flat in masters if not any(location.values())]
+        if not default:
+            return
+        self.flat = default[0]
+        # Masters which won't interpolate are left out, as they would be
+        # reported by the compatibility check anyway
+        compatible = [
+            (location, flat)
+            for location, flat in masters
+            if flat.structure() == self.flat.structure()
+        ]
+        locations = [location for location, flat in compatible]
+        values = [
+            numpy.array(flat.coordinates + [flat.width], dtype=float)
+            for location, flat in compatible
+        ]
+        try:
+            self.model = VariationModel(locations, axisOrder=list(self.axes))
+        except (VariationModelError, ValueError) as e:
+            # Two sources at the same location, say
+            print("Can't interpolate %s: %s" % (glyph, e))
+            return
+        self.deltas = numpy.array(self.model.getDeltas(values))
+        self.available = True
+
+    def normalize(self, location):
+        location = {
+            name: (location or {}).get(name, default)
+            for name, (minimum, default, maximum) in self.axes.items()
+        }
+        normalized = normalizeLocation(location, self.axes)
+        # Not giving -0.0s to the VariationModel
+        return {name: value + 0.0 for name, value in normalized.items()}
+
+    def at(self, location):
+        """The glyph at a location (in design coordinates), or None."""
+        if not self.available:
+            return None
+        scalars = numpy.array(self.model.getScalars(self.normalize(location)))
+        return InterpolatedGlyph(self.flat, (scalars @ self.deltas).tolist())
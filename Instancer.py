@@ -0,0 +1,230 @@
+"""Makes static TrueType instances by instantiating a compiled variable font.
+
+Interpolating each instance from the sources and compiling it with fontmake
+repeats most of the work already done to build the variable font. When the
+variable font is being built anyway, cutting each instance out of it with
+fontTools.varLib.instancer costs a fraction of that. The instancing runs on
+the build workers, which never import Qt, so nothing here may either."""
+
+import logging
+import os
+import plistlib
+import time
+
+from fontTools.designspaceLib import InstanceDescriptor
+from fontTools.ttLib import TTFont
+from fontTools.varLib import instancer
+
+from BuildTasks import (
+    STATUS_OK,
+    STATUS_FAILED,
+    STATUS_UP_TO_DATE,
+    variable_font_path,
+)
+
+logger = logging.getLogger(__name__)
+
+RIBBI = ("Regular", "Italic", "Bold", "Bold Italic")
+
+
+def user_location(designspace, descriptor):
+    """The user-space coordinates the instancer wants for an instance or a
+    source, keyed by axis tag. Instances may be placed by design or by user
+    coordinates (designspace 5), so each is asked for its full location
+    rather than reading the design-only `location`."""
+    if isinstance(descriptor, InstanceDescriptor):
+        location = descriptor.getFullUserLocation(designspace)
+    else:
+        location = designspace.map_backward(
+            descriptor.getFullDesignLocation(designspace)
+        )
+    return {axis.tag: location[axis.name] for axis in designspace.axes}
+
+
+def font_names(family, style, postscript_name=None):
+    """The name table entries for a static font of this family and style."""
+    family = family or "Untitled"
+    style = style or "Regular"
+    names = {
+        4: "%s %s" % (family, style),
+        6: postscript_name or ("%s-%s" % (family, style)).replace(" ", ""),
+    }
+    if style in RIBBI:
+        names[1] = family
+        names[2] = style
+    else:
+        names[1] = "%s %s" % (family, style)
+        names[2] = "Italic" if "Italic" in style.split() else "Regular"
+        names[16] = family
+        names[17] = style
+    return names
+
+
+def file_name(family, style):
+    # The same as fontmake's names for instances
+    return "%s-%s.ttf" % (
+        (family or "None").replace(" ", ""),
+        (style or "None").replace(" ", ""),
+    )
+
+
+def source_names(source):
+    """A source's family and style names, from the designspace if it has
+    them and otherwise from the UFO."""
+    family, style = source.familyName, source.styleName
+    if not (family and style):
+        try:
+            with open(os.path.join(source.path, "fontinfo.plist"), "rb") as f:
+                info = plistlib.load(f)
+        except (OSError, ValueError):
+            info = {}
+        family = family or info.get("familyName")
+        style = style or info.get("styleName")
+    return family, style
+
+
+def set_font_names(font, names):
+    """Gives the font the names a static font of its own would have. The
+    unique ID (name 3) is made as ufo2ft makes it, from the version, the
+    vendor and the PostScript name, as the variable font's names its
+    default source."""
+    name = font["name"]
+    for name_id in (1, 2, 3, 4, 6, 16, 17):
+        name.removeNames(nameID=name_id)
+    names = dict(names)
+    names[3] = "%.3f;%s;%s" % (
+        font["head"].fontRevision,
+        font["OS/2"].achVendID.strip(),
+        names[6],
+    )
+    for name_id, string in names.items():
+        name.setName(string, name_id, 3, 1, 0x409)
+
+
+def set_style_bits(font, style):
+    """Sets the bold, italic and regular bits of OS/2 fsSelection and head
+    macStyle for a style map style ("Regular", "Italic", "Bold" or "Bold
+    Italic"), which otherwise are those of the variable font's default."""
+    bold = style in ("Bold", "Bold Italic")
+    italic = style in ("Italic", "Bold Italic")
+    font["head"].macStyle = (font["head"].macStyle & ~0b11) | bold | italic << 1
+    selection = font["OS/2"].fsSelection & ~(1 << 0 | 1 << 5 | 1 << 6)
+    if italic:
+        selection |= 1 << 0
+    if bold:
+        selection |= 1 << 5
+    if not (bold or italic):
+        selection |= 1 << 6
+    font["OS/2"].fsSelection = selection
+
+
+def static_fonts(designspace_file, designspace, options, output_dir):
+    """Returns (label, location, names, output file) for each static font to
+    be cut from the variable font: the named instances and, if asked for,
+    the masters."""
+    fonts = []
+    seen = set()
+    if options.output_instances:
+        for instance in designspace.instances:
+            family, style = instance.familyName, instance.styleName
+            names = font_names(family, style, instance.postScriptFontName)
+            fonts.append(
+                (
+                    instance.name or names[4],
+                    user_location(designspace, instance),
+                    names,
+                    os.path.join(output_dir, file_name(family, style)),
+                )
+            )
+            seen.add(fonts[-1][3])
+    if options.masters_as_instances:
+        for source in designspace.sources:
+            family, style = source_names(source)
+            if os.path.join(output_dir, file_name(family, style)) in seen:
+                # A named instance at the same place
+                continue
+            names = font_names(family, style)
+            fonts.append(
+                (
+                    names[4],
+                    user_location(designspace, source),
+                    names,
+                    os.path.join(output_dir, file_name(family, style)),
+                )
+            )
+    return fonts
+
+
+def run_instancer(
+    variable_font,
+    location,
+    names,
+    output_file,
+    use_cache=False,
+    progress=None,
+    label="",
+):
+    """Cuts one static instance out of a variable font, returning a
+    (status, message) pair as run_fontmake does.
+
+    With `use_cache`, an instance which is newer than the variable font is
+    up to date: the variable font is only rebuilt when the designspace (which
+    holds the instance's location and names) or the sources change."""
+    if (
+        use_cache
+        and os.path.exists(output_file)
+        and os.path.getmtime(output_file) >= os.path.getmtime(variable_font)
+    ):
+        return STATUS_UP_TO_DATE, ""
+    started = time.monotonic()
+
+    def report(stage, fraction, **kwargs):
+        if progress:
+            event = {
+                "stage": stage,
+                "label": "Instancing from the variable font",
+                "task": label,
+                "elapsed": time.monotonic() - started,
+                "stage_elapsed": time.monotonic() - started,
+                "glyphs": 0,
+                "fraction": fraction,
+            }
+            event.update(kwargs)
+            progress(event)
+
+    try:
+        report("instance", 0)
+        font = instancer.instantiateVariableFont(TTFont(variable_font), location)
+        set_font_names(font, names)
+        set_style_bits(font, names[2])
+        if "wght" in location:
+            font["OS/2"].usWeightClass = int(round(location["wght"]))
+        # What is left of the variable font's STAT describes one point of
+        # its axes, which fontmake's static fonts don't have either
+        if "STAT" in font:
+            del font["STAT"]
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        font.save(output_file)
+    except Exception as e:
+        logger.error("%s: %s", output_file, e)
+        return STATUS_FAILED, str(e)
+    report("done", 1.0, timings={"instance": time.monotonic() - started})
+    return STATUS_OK, ""
+
+
+def instancer_jobs(designspace_file, designspace, options, use_cache=False):
+    """Jobs for BuildTasks.run_pool which make each static TrueType font from
+    the variable font, into the same instance_ttf directory fontmake uses."""
+    output_dir = os.path.join(
+        os.path.dirname(os.path.abspath(designspace_file)), "instance_ttf"
+    )
+    return [
+        (
+            label,
+            run_instancer,
+            (variable_font_path(designspace_file), location, names, output, use_cache),
+        )
+        for label, location, names, output in static_fonts(
+            designspace_file, designspace, options, output_dir
+        )
+    ]
@@ -0,0 +1,356 @@
+"""Keeps the outlines of each source UFO in a compact binary file.
+
+Reading a glyph from a UFO means parsing its glif's XML, which is most of the
+time the compatibility check takes. Instead, each UFO's glyphs (their
+points, point types, components, anchors and advances) are packed into one
+file in the cache directory. Each glyph's entry is replaced only when its
+glif changes, and the file is memory-mapped, so reading a glyph from it is
+just unpacking a few arrays.
+
+Each update writes a complete new file (and an index naming it), so processes
+reading the old one aren't disturbed. The check's worker processes read
+their outlines from here, and they don't load Qt."""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fontTools.pens.pointPen import PointToSegmentPen
+from fontTools.ufoLib import glifLib
+
+from BuildTasks import mp_context
+from Cache import FileHasher, cache_dir, key_for, read_json, write_json
+from CheckCache import glif_files
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+
+# Point types, as stored; smooth points have SMOOTH added
+POINT_TYPES = [None, "move", "line", "curve", "qcurve"]
+POINT_CODES = {t: i for i, t in enumerate(POINT_TYPES)}
+SMOOTH = 8
+
+# Advance width and height; then the number of contours, points,
+# components and anchors
+HEADER = struct.Struct("<ddIIII")
+TRANSFORM = struct.Struct("<6d")
+ANCHOR = struct.Struct("<2d")
+NAME_LENGTH = struct.Struct("<H")
+
+# Parsing glifs in other processes is worth it beyond this many
+MIN_PARALLEL_GLIFS = 500
+
+# One update of a UFO's cache at a time in this process
+update_lock = threading.Lock()
+
+
+class GlyphPacker:
+    """A point pen (and glyph object for glifLib) collecting one glyph."""
+
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.anchors = []
+        self.contour_ends = []
+        self.coordinates = []
+        self.types = []
+        self.components = []
+
+    def beginPath(self, identifier=None, **kwargs):
+        pass
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None, **kwargs):
+        self.coordinates.extend(pt)
+        self.types.append(POINT_CODES[segmentType] + (SMOOTH if smooth else 0))
+
+    def endPath(self):
+        self.contour_ends.append(len(self.types))
+
+    def addComponent(self, baseGlyph, transformation, identifier=None, **kwargs):
+        self.components.append((baseGlyph, tuple(transformation)))
+
+    def pack(self):
+        chunks = [
+            HEADER.pack(
+                self.width or 0,
+                self.height or 0,
+                len(self.contour_ends),
+                len(self.types),
+                len(self.components),
+                len(self.anchors),
+            ),
+            struct.pack("<%id" % len(self.coordinates), *self.coordinates),
+            struct.pack("<%iI" % len(self.contour_ends), *self.contour_ends),
+            bytes(self.types),
+        ]
+        for base, transformation in self.components:
+            chunks.append(TRANSFORM.pack(*transformation))
+            chunks.append(pack_name(base))
+        for anchor in self.anchors:
+            chunks.append(ANCHOR.pack(anchor.get("x", 0), anchor.get("y", 0)))
+            chunks.append(pack_name(anchor.get("name") or ""))
+        data = b"".join(chunks)
+        # Keep every glyph's coordinates aligned
+        return data + b"\0" * (-len(data) % 8)
+
+
+def pack_name(name):
+    encoded = name.encode("utf-8")
+    return NAME_LENGTH.pack(len(encoded)) + encoded
+
+
+def pack_glif(filename):
+    packer = GlyphPacker()
+    with open(filename, "rb") as f:
+        glifLib.readGlyphFromString(f.read(), packer, packer)
+    return packer.pack()
+
+
+def pack_glifs(filenames):
+    """Runs on a worker: packs some glifs."""
+    return [pack_glif(filename) for filename in filenames]
+
+
+class CachedGlyph:
+    """A glyph read from the cache. Draws like the glyphs in a
+    UFOReader's glyph set, and has its `contours` as lists of (x, y,
+    segment type), its `components` as (base glyph, transformation) and
+    its `anchors` as (name, x, y)."""
+
+    def __init__(self, name, data):
+        self.name = name
+        (
+            self.width,
+            self.height,
+            contours,
+            points,
+            components,
+            anchors,
+        ) = HEADER.unpack_from(data)
+        offset = HEADER.size
+        self.coordinates = data[offset : offset + 16 * points].cast("d")
+        offset += 16 * points
+        self.contour_ends = data[offset : offset + 4 * contours].cast("I")
+        offset += 4 * contours
+        self.types = data[offset : offset + points]
+        offset += points
+        self.components = []
+        for i in range(components):
+            transformation = TRANSFORM.unpack_from(data, offset)
+            base, offset = unpack_name(data, offset + TRANSFORM.size)
+            self.components.append((base, transformation))
+        self.anchors = []
+        for i in range(anchors):
+            x, y = ANCHOR.unpack_from(data, offset)
+            name, offset = unpack_name(data, offset + ANCHOR.size)
+            self.anchors.append((name, x, y))
+
+    @property
+    def contours(self):
+        contours = []
+        start = 0
+        for end in self.contour_ends:
+            contours.append(
+                [
+                    (
+                        self.coordinates[2 * i],
+                        self.coordinates[2 * i + 1],
+                        POINT_TYPES[self.types[i] & ~SMOOTH],
+                    )
+                    for i in range(start, end)
+                ]
+            )
+            start = end
+        return contours
+
+    def drawPoints(self, pointPen):
+        start = 0
+        for end in self.contour_ends:
+            pointPen.beginPath()
+            for i in range(start, end):
+                pointPen.addPoint(
+                    (self.coordinates[2 * i], self.coordinates[2 * i + 1]),
+                    segmentType=POINT_TYPES[self.types[i] & ~SMOOTH],
+                    smooth=bool(self.types[i] & SMOOTH),
+                )
+            pointPen.endPath()
+            start = end
+        for base, transformation in self.components:
+            pointPen.addComponent(base, transformation)
+
+    def draw(self, pen, outputImpliedClosingLine=False):
+        self.drawPoints(
+            PointToSegmentPen(pen, outputImpliedClosingLine=outputImpliedClosingLine)
+        )
+
+
+def unpack_name(data, offset):
+    (length,) = NAME_LENGTH.unpack_from(data, offset)
+    offset += NAME_LENGTH.size
+    return bytes(data[offset : offset + length]).decode("utf-8"), offset + length
+
+
+class OutlineCache:
+    """The cached outlines of one UFO's default layer. Use as a glyph set:
+    `keys()`, `in` and `[name]` (which gives a CachedGlyph)."""
+
+    def __init__(self, ufo_path, update=True, jobs=1):
+        self.ufo_path = os.path.abspath(ufo_path)
+        self.index_path = os.path.join(
+            cache_dir("outlines"), key_for(self.ufo_path) + ".json"
+        )
+        self.files = glif_files(self.ufo_path)
+        if self.files is None:
+            raise ValueError("%s isn't a UFO directory" % ufo_path)
+        if update:
+            with update_lock:
+                self.update(jobs)
+        self.open()
+
+    def open(self):
+        # A newer update may have removed the file the index we read named;
+        # the index naming its replacement is in place by then
+        for attempt in range(3):
+            self.index = read_json(self.index_path, {})
+            try:
+                with open(self.data_path(self.index), "rb") as f:
+                    self.data = memoryview(
+                        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    )
+                return
+            except (OSError, ValueError):
+                pass
+        self.index = {}
+        self.data = memoryview(b"")
+
+    def data_path(self, index):
+        return os.path.join(cache_dir("outlines"), index.get("file") or "missing.bin")
+
+    def update(self, jobs=1):
+        """Packs the glyphs whose glifs have changed since they were last
+        cached, and writes a new cache file if any have."""
+        index = read_json(self.index_path, {})
+        glyphs = index.get("glyphs", {}) if index.get("format") == FORMAT else {}
+        hasher = FileHasher(self.ufo_path)
+        digests = {}
+        for name, filename in self.files.items():
+            try:
+                digests[name] = hasher.digest(filename)
+            except OSError:
+                pass
+        hasher.save()
+        stale = [
+            name
+            for name, digest in digests.items()
+            if glyphs.get(name, [None])[0] != digest
+        ]
+        if not stale and set(glyphs) == set(digests):
+            return
+        logger.info("Caching outlines of %i glyphs in %s", len(stale), self.ufo_path)
+
+        packed = dict(zip(stale, self.pack(stale, jobs)))
+        old = None
+        if glyphs:
+            try:
+                with open(self.data_path(index), "rb") as f:
+                    old = f.read()
+            except OSError:
+                # Pack the rest again too, leaving out glyphs deleted since
+                unpacked = [x for x in digests if x in glyphs and x not in packed]
+                packed.update(zip(unpacked, self.pack(unpacked, jobs)))
+                old = None
+
+        name = "%s-%i-%i.bin" % (key_for(self.ufo_path), os.getpid(), id(packed))
+        path = os.path.join(cache_dir("outlines"), name)
+        entries = {}
+        offset = 0
+        with open(path, "wb") as f:
+            for glyph, digest in digests.items():
+                if glyph in packed:
+                    data = packed[glyph]
+                elif old is not None and glyph in glyphs:
+                    start, length = glyphs[glyph][1:3]
+                    data = old[start : start + length]
+                else:
+                    continue
+                f.write(data)
+                entries[glyph] = [digest, offset, len(data)]
+                offset += len(data)
+        write_json(self.index_path, {"format": FORMAT, "file": name, "glyphs": entries})
+        # Only the file this update replaces: another process may have
+        # written a newer one since we read the index, and be reading it
+        if index.get("file") and index["file"] != name:
+            try:
+                os.remove(self.data_path(index))
+            except OSError:
+                # Still mapped by someone, on Windows
+                pass
+
+    def pack(self, names, jobs):
+        filenames = [self.files[name] for name in names]
+        if jobs <= 1 or len(filenames) < MIN_PARALLEL_GLIFS:
+            return pack_glifs(filenames)
+        size = -(-len(filenames) // (jobs * 4))
+        chunks = [filenames[i : i + size] for i in range(0, len(filenames), size)]
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(chunks)), mp_context=mp_context
+        ) as pool:
+            return [data for chunk in pool.map(pack_glifs, chunks) for data in chunk]
+
+    def keys(self):
+        return self.index.get("glyphs", {}).keys()
+
+    def __contains__(self, name):
+        return name in self.index.get("glyphs", {})
+
+    def __len__(self):
+        return len(self.index.get("glyphs", {}))
+
+    def __getitem__(self, name):
+        digest, offset, length = self.index["glyphs"][name]
+        return CachedGlyph(name, self.data[offset : offset + length])
+
+    def digest(self, name):
+        """Identifies this version of the glyph's glif."""
+        return self.index["glyphs"][name][0]
+
+
+class UncachedGlyphs:
+    """The glyph set for UFOs which can't be cached (such as .ufoz files):
+    reads each glyph from the UFO, but gives CachedGlyphs all the same."""
+
+    def __init__(self, ufo_path):
+        from fontTools.ufoLib import UFOReader
+
+        self.glyphset = UFOReader(ufo_path).getGlyphSet()
+
+    def keys(self):
+        return self.glyphset.keys()
+
+    def __contains__(self, name):
+        return name in self.glyphset
+
+    def __len__(self):
+        return len(self.glyphset)
+
+    def __getitem__(self, name):
+        packer = GlyphPacker()
+        self.glyphset.readGlyph(name, packer, packer)
+        return CachedGlyph(name, memoryview(packer.pack()))
+
+    def digest(self, name):
+        # Not worth working out without the cache's file stamps
+        return None
+
+
+def glyph_set(ufo_path, update=True, jobs=1):
+    """The cached glyph set for a UFO, or an UncachedGlyphs for UFOs which
+    can't be cached."""
+    try:
+        return OutlineCache(ufo_path, update=update, jobs=jobs)
+    except ValueError:
+        return UncachedGlyphs(ufo_path)
@@ -0,0 +1,113 @@
+from PyQt5.QtCore import *
+from CompatibilityCheck import Status
+
+COLUMNS = ["Glyph", "Status", "Type", "Message"]
+
+
+class ProblemsModel(QAbstractTableModel):
+    """The compatibility check's problems, one row per problem, for showing
+    in a QTableView. The view only asks for the rows on screen, so this
+    copes with very many problems where a QTableWidget (with an item for
+    every cell) would not.
+
+    Sorting and filtering are done here rather than with a
+    QSortFilterProxyModel, which would call data() for every comparison:
+    `visible` holds the indexes into `rows` of the rows which pass the
+    filter, in display order."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.search = []
+        self.visible = []
+        self.filter_text = ""
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.visible)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole or role == Qt.ToolTipRole:
+            return self.rows[self.visible[index.row()]][index.column()]
+        return None
+
+    def clear(self):
+        self.beginResetModel()
+        self.rows = []
+        self.search = []
+        self.visible = []
+        self.endResetModel()
+
+    def addProblems(self, problems):
+        """Adds rows for a dict of glyph name to problems, which have been
+        through clean_problems."""
+        first = len(self.rows)
+        for glyph, glyph_problems in problems.items():
+            for p in glyph_problems:
+                row = (glyph, p["status"], p["type"], p["message"])
+                self.rows.append(row)
+                self.search.append("\t".join(row).lower())
+        added = [
+            i for i in range(first, len(self.rows)) if self.matches(i, self.filter_text)
+        ]
+        if not added:
+            return
+        if self.sort_column is not None:
+            self.layoutAboutToBeChanged.emit()
+            self.visible.extend(added)
+            self.sortVisible()
+            self.layoutChanged.emit()
+        else:
+            self.beginInsertRows(
+                QModelIndex(), len(self.visible), len(self.visible) + len(added) - 1
+            )
+            self.visible.extend(added)
+            self.endInsertRows()
+
+    def matches(self, i, text):
+        return not text or text in self.search[i]
+
+    def setFilterText(self, text):
+        text = text.strip().lower()
+        if text == self.filter_text:
+            return
+        # Typing more of the same search only ever narrows it down, so only
+        # the rows already showing need looking at
+        narrowing = self.filter_text and text.startswith(self.filter_text)
+        candidates = self.visible if narrowing else range(len(self.rows))
+        self.filter_text = text
+        self.beginResetModel()
+        self.visible = [i for i in candidates if self.matches(i, text)]
+        if self.sort_column is not None and not narrowing:
+            self.sortVisible()
+        self.endResetModel()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # A column of -1 means unsorted: the order the problems were found
+        self.sort_column = column if column >= 0 else None
+        self.sort_order = order
+        self.layoutAboutToBeChanged.emit()
+        self.sortVisible()
+        self.layoutChanged.emit()
+
+    def sortVisible(self):
+        column = self.sort_column
+        rows = self.rows
+        if column is None:
+            self.visible.sort()
+            return
+        if COLUMNS[column] == "Status":
+            # Most serious first when descending
+            key = lambda i: (Status[rows[i][1]], rows[i][0])
+        else:
+            key = lambda i: (rows[i][column], rows[i][0])
+        self.visible.sort(key=key, reverse=self.sort_order == Qt.DescendingOrder)
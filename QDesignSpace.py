@@ -1,30 +1,59 @@
-from beziers.path import BezierPath
-from fontTools.ttLib import TTFont
 from fontTools.designspaceLib import DesignSpaceDocument
-import defcon
-from beziers.path.representations.Nodelist import NodelistRepresentation, Node
-from beziers.path.representations.Segment import SegmentRepresentation
-from beziers.affinetransformation import AffineTransformation
-from beziers.point import Point
-from mpl_toolkits.mplot3d import art3d
-from matplotlib.backends.backend_qt5agg import (
-        FigureCanvas, NavigationToolbar2QT as NavigationToolbar)
-from PyQt5.QtWidgets import QWidget, QApplication, QVBoxLayout
-from matplotlib.figure import Figure
+from fontTools.pens.qtPen import QtPen
+from GlyphReader import glyph_reader
+from InstancePreview import Interpolator
+from PyQt5.QtWidgets import (QWidget, QApplication, QVBoxLayout, QGraphicsView,
+        QGraphicsScene, QGraphicsItem, QGraphicsSimpleTextItem)
+from PyQt5.QtCore import Qt, QTimer, QRectF, QLineF
+from PyQt5.QtGui import QPainter, QPainterPath, QTransform, QBrush, QColor, QPen, QFont
+import math
 import sys
-import matplotlib.patches as patches
+
+# (source path, glyph name) -> (digests of the glyph and its components,
+# QPainterPath of the glyph, ready to be placed). Shared by all the
+# visualizers, as the wizard pages make a new one each time they are shown
+glyph_paths = {}
+
+# Redraw at most this often, however fast the locations change (in ms)
+FRAME_INTERVAL = 16
+
+# The size of the plot in the scene; a glyph's em is a tenth of the width
+PLOT_WIDTH = 1000.0
+PLOT_HEIGHT = {1: 200.0, 2: 750.0}
+GLYPH_SCALE = PLOT_WIDTH / 10000
+LABEL_SHIFT = 75.0
+MARGINS = (90.0, 110.0, 110.0, 90.0) # left, top, right, bottom
+
+GLYPH_COLOR = QColor("#1f77b4")
+INSTANCE_COLOR = QColor("#ff7f0e")
 
 class DesignSpaceVisualizer(QWidget):
-  def __init__(self, designspace, parent = None, draw_glyph = False):
+  """Shows where the sources are in the designspace, and with `draw_glyph`
+  what that glyph looks like in each of them; with `draw_instances` too,
+  the glyph is interpolated at each instance's location. One and two axis
+  designspaces are drawn with a QGraphicsScene; more axes need matplotlib's
+  3D plots."""
+  def __init__(self, designspace, parent = None, draw_glyph = False, draw_instances = False):
     super().__init__(parent)
     self.designspace = designspace
     self.draw_glyph = draw_glyph
+    self.draw_instances = draw_instances
     self.layout = QVBoxLayout(self)
-    self.figure = Figure()
-    self.canvas = FigureCanvas(self.figure)
-    self.layout.addWidget(self.canvas)
     self.axis_count = len(self.designspace.axes)
-    self.ax = self.setup_axes()
+    self.glyphsets = {}
+    self.interpolator = None
+    if self.axis_count <= 2:
+      self.renderer = SceneRenderer(self)
+    else:
+      from QDesignSpacePlot import PlotRenderer
+      self.renderer = PlotRenderer(self)
+    self.layout.addWidget(self.renderer)
+    # Changes asked for before the next frame are drawn together
+    self.frame = QTimer(self)
+    self.frame.setSingleShot(True)
+    self.frame.setInterval(FRAME_INTERVAL)
+    self.frame.timeout.connect(self.draw_frame)
+    self.reload_pending = False
     self.refresh()
 
 
@@ -42,141 +71,276 @@ class DesignSpaceVisualizer(QWidget):
                 self._clearLayout(item.layout())
 
   def refresh(self):
-    self.labels_and_limits()
+    """Rereads the glyph from the sources and draws everything again, at
+    the next frame."""
+    self.reload_pending = True
+    self.schedule()
+
+  def updateLocations(self):
+    """Moves the sources' glyphs to where the sources are now, and
+    interpolates the instances' glyphs again, at the next frame."""
+    self.schedule()
+
+  def schedule(self):
+    # Not restarting a running timer, so that a steady stream of changes
+    # (a held-down spin box arrow) is still drawn every frame
+    if not self.frame.isActive():
+      self.frame.start()
+
+  def draw_frame(self):
+    if self.reload_pending:
+      self.reload_pending = False
+      self.load_glyphs()
+      self.renderer.redraw()
+    else:
+      self.renderer.move_glyphs()
+
+  def load_glyphs(self):
     if self.draw_glyph:
-      self.designspace.loadSourceFonts(defcon.Font)
-      if self.axis_count == 3:
-        self.do_three_axis()
-      elif 1 <= self.axis_count <= 2:
-        self.do_one_or_two_axis()
-    self.canvas.draw()
-
-  def glyph_to_paths(self, glyph):
-    paths = []
-    for c in glyph:
-      path = BezierPath()
-      path.closed = False
-      nodeList = []
-      for p in c:
-        t = p.segmentType
-        if t is None:
-          t = "offcurve"
-        elif "line" in t:
-          t = "line"
-        else:
-          t = "curve"
-        nodeList.append(Node(p.x,p.y,t))
-      path.activeRepresentation = NodelistRepresentation(path, nodeList)
-      if nodeList[0].point != nodeList[-1].point:
-        nodeList.append(nodeList[0])
-      paths.append(path)
-    return paths
-
-  def do_three_axis(self):
-    x_axis, y_axis, z_axis = self.designspace.axes[0:3]
+      # Only the glyphs drawn are read from each source (see GlyphReader)
+      self.glyphsets = { s.path: glyph_reader(s.path) for s in self.designspace.sources }
+    if self.draw_glyph and self.draw_instances:
+      # The masters' deltas are worked out here, once; each instance is
+      # then quick to interpolate (see InstancePreview)
+      self.interpolator = Interpolator(self.designspace, self.draw_glyph, self.glyphsets)
+    else:
+      self.interpolator = None
+
+  def instances(self):
+    """The instances to draw."""
+    if not self.interpolator or not self.interpolator.available:
+      return []
+    return self.designspace.instances
+
+  def glyph_shape(self, source, cache, convert):
+    """The glyph to draw for a source, made by convert(glyphset, glyph)
+    unless it is in the cache already, or None."""
+    glyphset = self.glyphsets.get(source.path)
+    if glyphset is None or self.draw_glyph not in glyphset:
+      return None
+    # The glyph's components are drawn into its shape, so a change to any
+    # of them (however deeply nested) makes a new one
+    digests = glyphset.digests(self.draw_glyph)
+    key = (source.path, self.draw_glyph)
+    if digests and cache.get(key, (None,))[0] == digests:
+      return cache[key][1]
+    shape = convert(glyphset, glyphset[self.draw_glyph])
+    if digests:
+      # Replacing the shape of any older version of the glyph
+      cache[key] = (digests, shape)
+    return shape
+
+  def instance_shape(self, instance, convert):
+    """The glyph interpolated at an instance's location, made by
+    convert(glyphset, glyph), or None."""
+    glyph = self.interpolator.at(instance.location)
+    if glyph is None:
+      return None
+    return convert(None, glyph)
+
+  def label_text(self, source):
     styles_are_unique = len(set([s.styleName for s in self.designspace.sources])) == len(self.designspace.sources)
+    if styles_are_unique:
+      fn = source.styleName
+    else:
+      fn = source.filename
+    fn = fn.replace("-","-\n")
+    fn = fn.replace(" ","\n")
+    return fn
 
-    for source in self.designspace.sources:
-      loc = source.location
-      if x_axis.name not in loc or y_axis.name not in loc or z_axis.name not in loc:
-        continue
-      at = AffineTransformation.scaling(
-          (x_axis.maximum-x_axis.minimum)/10000,
-          (z_axis.maximum-z_axis.minimum)/10000,
-          )
-      if styles_are_unique:
-        fn = source.styleName
-      else:
-        fn = source.filename
-      fn = fn.replace("-","-\n")
-      fn = fn.replace(" ","\n")
-      z_shift = 1.0/10*(z_axis.maximum-z_axis.minimum)
-      xloc = x_axis.map_backward(loc[x_axis.name])
-      yloc = y_axis.map_backward(loc[y_axis.name])
-      zloc = z_axis.map_backward(loc[z_axis.name])
-      self.ax.text(xloc, yloc, zloc+z_shift, fn, None, wrap=True, size="x-small")
-      at.translate(Point(xloc,zloc))
-      if self.draw_glyph in source.font:
-        a = source.font[self.draw_glyph]
-        self.do_draw_glyph(a, at, z_loc=yloc)
-
-  def do_one_or_two_axis(self):
+  def source_position(self, source):
+    """Where a source (or instance) is on a one or two axis designspace,
+    in user coordinates, or None."""
     x_axis = self.designspace.axes[0]
-    styles_are_unique = len(set([s.styleName for s in self.designspace.sources])) == len(self.designspace.sources)
-    if self.axis_count >= 2:
+    loc = source.location or {}
+    if x_axis.name not in loc:
+      return None
+    if self.axis_count == 2:
       y_axis = self.designspace.axes[1]
+      if y_axis.name not in loc:
+        return None
+      yloc = y_axis.map_backward(loc[y_axis.name])
     else:
-      self.figure.subplots_adjust(bottom=0.2)
-    for source in self.designspace.sources:
-      at = AffineTransformation.scaling(
-          (self.ax.get_xlim()[1]-self.ax.get_xlim()[0])/10000,
-          (self.ax.get_ylim()[1]-self.ax.get_ylim()[0])/10000,
-          )
-      loc = source.location
-      if x_axis.name not in loc:
-        continue
-      if styles_are_unique:
-        fn = source.styleName
-      else:
-        fn = source.filename
-      fn = fn.replace("-","-\n")
-      fn = fn.replace(" ","\n")
-      y_shift = 1.0/10*(self.ax.get_ylim()[1]-self.ax.get_ylim()[0])
-      if self.axis_count == 2:
-        if y_axis.name not in loc:
-          continue
-        yloc = y_axis.map_backward(loc[y_axis.name])
-      else:
-        yloc = 0
-      xloc = x_axis.map_backward(loc[x_axis.name])
-      # print(fn, xloc, yloc)
-      self.ax.text(xloc, yloc+y_shift, fn, None, wrap=True, size="x-small")
-      at.translate(Point(xloc,yloc))
-      if self.draw_glyph in source.font:
-        a = source.font[self.draw_glyph]
-        self.do_draw_glyph(a, at)
-
-  def do_draw_glyph(self, glyph, transformation, z_loc=None):
-      paths = self.glyph_to_paths(glyph)
-      bounds = paths[0].bounds()
-      for p in paths[1:]:
-        bounds.extend(p.bounds())
-      width = bounds.width/2
-      height = bounds.height/2
-      for p in paths:
-        seg2 = [ x.translated(Point(-width/2,-height/2)).transformed(transformation) for x in p.asSegments()]
-        p.activeRepresentation = SegmentRepresentation(p, seg2)
-        mp = p.asMatplot()
-
-        patch = patches.PathPatch(mp, fill=True,clip_on=False, linewidth=0)
-        self.ax.add_patch(patch)
-        if self.ax.name == "3d":
-          art3d.pathpatch_2d_to_3d(patch, z=z_loc,zdir="y")
-
-  def setup_axes(self):
-    if len(self.designspace.axes) > 2:
-      ax = self.canvas.figure.add_subplot(111, projection='3d')
-    else:
-      ax = self.canvas.figure.add_subplot(111)
-    if self.axis_count == 1:
-      ax.yaxis.set_visible(False)
-      ax.spines["top"].set_visible(False)
-      ax.spines["right"].set_visible(False)
-      ax.spines["left"].set_visible(False)
-    return ax
-
-  def labels_and_limits(self):
-    self.ax.clear()
-    methods = [
-      ("set_xlim", "set_xlabel"),
-      ("set_ylim", "set_ylabel"),
-      ("set_zlim", "set_zlabel")
-    ]
-    for i, axis in enumerate(self.designspace.axes):
-      if i >= self.axis_count:
-        break
-      getattr(self.ax,methods[i][0])([axis.minimum, axis.maximum])
-      getattr(self.ax,methods[i][1])(axis.name)
+      yloc = 0
+    return x_axis.map_backward(loc[x_axis.name]), yloc
+
+
+def glyph_to_path(glyphset, glyph):
+  pen = QtPen(glyphset)
+  glyph.draw(pen)
+  path = pen.path
+  if path.isEmpty():
+    return None
+  # Placed near the source's location, as the glyphs always have been
+  bounds = path.boundingRect()
+  path.translate(-bounds.width()/4, -bounds.height()/4)
+  return path
+
+def nice_ticks(minimum, maximum, count=8):
+  """Round numbers from minimum to maximum, at most about `count` of them."""
+  span = maximum - minimum
+  if span <= 0:
+    return [minimum]
+  step = 10 ** math.floor(math.log10(span / count))
+  for multiple in (1, 2, 2.5, 5, 10):
+    if span / (step * multiple) <= count:
+      step = step * multiple
+      break
+  first = math.ceil(minimum / step)
+  return [ i * step for i in range(first, int(math.floor(maximum / step)) + 1) ]
+
+
+class SceneRenderer(QGraphicsView):
+  """Draws one and two axis designspaces. The glyphs are QPainterPaths,
+  made once, and moving a source only moves its items, so only the bits of
+  the view they cover are repainted. The wheel zooms; drag to pan, and
+  double-click to fit everything in again."""
+  def __init__(self, visualizer):
+    super().__init__(visualizer)
+    self.visualizer = visualizer
+    self.designspace = visualizer.designspace
+    self.scene = QGraphicsScene(self)
+    self.setScene(self.scene)
+    self.setRenderHint(QPainter.Antialiasing)
+    self.setDragMode(QGraphicsView.ScrollHandDrag)
+    self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+    self.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
+    self.zoomed = False
+    self.font = QFont()
+    self.font.setPointSizeF(self.font.pointSizeF() * 0.8)
+    self.height = PLOT_HEIGHT.get(len(self.designspace.axes), PLOT_HEIGHT[1])
+    left, top, right, bottom = MARGINS
+    self.scene.setSceneRect(QRectF(-left, -top, PLOT_WIDTH+left+right, self.height+top+bottom))
+    # id(source or instance) -> (label, glyph item or None), for moving
+    # them about
+    self.artists = {}
+
+  def to_scene(self, xloc, yloc):
+    x_axis = self.designspace.axes[0]
+    x = (xloc - x_axis.minimum) / ((x_axis.maximum - x_axis.minimum) or 1) * PLOT_WIDTH
+    if len(self.designspace.axes) < 2:
+      return x, self.height
+    y_axis = self.designspace.axes[1]
+    y = (yloc - y_axis.minimum) / ((y_axis.maximum - y_axis.minimum) or 1) * self.height
+    return x, self.height - y
+
+  def text(self, text, x, y, dx=0, dy=0, centred=False):
+    """A label which stays the same size however the view is zoomed,
+    anchored at (x, y) in the scene and moved (dx, dy) pixels from there."""
+    item = QGraphicsSimpleTextItem(text)
+    item.setFont(self.font)
+    item.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+    bounds = item.boundingRect()
+    if centred:
+      dx = dx - bounds.width() / 2
+    if dy < 0:
+      # Above the point, rather than below it
+      dy = dy - bounds.height()
+    item.setTransform(QTransform.fromTranslate(dx, dy))
+    item.setPos(x, y)
+    self.scene.addItem(item)
+    return item
+
+  def redraw(self):
+    self.scene.clear()
+    self.artists = {}
+    if self.designspace.axes:
+      self.draw_axes()
+      if self.visualizer.draw_glyph:
+        for source in self.designspace.sources:
+          self.draw_source(source)
+        for instance in self.visualizer.instances():
+          self.draw_instance(instance)
+    self.fit()
+
+  def draw_axes(self):
+    pen = QPen(Qt.black, 0)
+    x_axis = self.designspace.axes[0]
+    for value in nice_ticks(x_axis.minimum, x_axis.maximum):
+      x, y = self.to_scene(value, 0)
+      self.scene.addLine(QLineF(x, self.height, x, self.height+8), pen)
+      self.text("%g" % value, x, self.height, dy=10, centred=True)
+    self.text(x_axis.name, PLOT_WIDTH/2, self.height, dy=30, centred=True)
+    if len(self.designspace.axes) < 2:
+      self.scene.addLine(QLineF(0, self.height, PLOT_WIDTH, self.height), pen)
+      return
+    self.scene.addRect(QRectF(0, 0, PLOT_WIDTH, self.height), pen)
+    y_axis = self.designspace.axes[1]
+    for value in nice_ticks(y_axis.minimum, y_axis.maximum):
+      x, y = self.to_scene(x_axis.minimum, value)
+      self.scene.addLine(QLineF(-8, y, 0, y), pen)
+      label = self.text("%g" % value, 0, y)
+      bounds = label.boundingRect()
+      label.setTransform(QTransform.fromTranslate(-bounds.width()-10, -bounds.height()/2))
+    name = self.text(y_axis.name, 0, self.height/2)
+    bounds = name.boundingRect()
+    name.setTransform(QTransform.fromTranslate(-60-bounds.height(), bounds.width()/2).rotate(-90))
+
+  def draw_source(self, source):
+    position = self.visualizer.source_position(source)
+    if not position:
+      return
+    x, y = self.to_scene(*position)
+    label = self.text(self.visualizer.label_text(source), x, y - LABEL_SHIFT, dy=-1)
+    path = self.visualizer.glyph_shape(source, glyph_paths, glyph_to_path)
+    item = None
+    if path is not None:
+      item = self.scene.addPath(path, QPen(Qt.NoPen), QBrush(GLYPH_COLOR))
+      item.setTransform(QTransform.fromScale(GLYPH_SCALE, -GLYPH_SCALE))
+      item.setPos(x, y)
+      # Only repainted when the view is zoomed, not when it's moved
+      item.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+    self.artists[id(source)] = (label, item)
+
+  def draw_instance(self, instance):
+    position = self.visualizer.source_position(instance)
+    if not position:
+      return
+    x, y = self.to_scene(*position)
+    label = self.text(instance.styleName or instance.name or "", x, y - LABEL_SHIFT, dy=-1)
+    label.setBrush(QBrush(INSTANCE_COLOR))
+    path = self.visualizer.instance_shape(instance, glyph_to_path)
+    item = self.scene.addPath(path or QPainterPath(), QPen(Qt.NoPen), QBrush(INSTANCE_COLOR))
+    item.setTransform(QTransform.fromScale(GLYPH_SCALE, -GLYPH_SCALE))
+    item.setPos(x, y)
+    self.artists[id(instance)] = (label, item)
+
+  def move_glyphs(self):
+    """Only the items' positions (and the instances' outlines) change,
+    unless sources or instances have come or gone."""
+    if not self.visualizer.draw_glyph:
+      return
+    sources = [ s for s in self.designspace.sources if self.visualizer.source_position(s) ]
+    instances = [ i for i in self.visualizer.instances() if self.visualizer.source_position(i) ]
+    if set(map(id, sources + instances)) != set(self.artists):
+      self.redraw()
+      return
+    for source in sources + instances:
+      label, item = self.artists[id(source)]
+      x, y = self.to_scene(*self.visualizer.source_position(source))
+      label.setPos(x, y - LABEL_SHIFT)
+      if item:
+        item.setPos(x, y)
+    for instance in instances:
+      label, item = self.artists[id(instance)]
+      item.setPath(self.visualizer.instance_shape(instance, glyph_to_path) or QPainterPath())
+
+  def fit(self):
+    if not self.zoomed:
+      self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
+
+  def resizeEvent(self, event):
+    super().resizeEvent(event)
+    self.fit()
+
+  def wheelEvent(self, event):
+    factor = 1.2 ** (event.angleDelta().y() / 120)
+    self.scale(factor, factor)
+    self.zoomed = True
+
+  def mouseDoubleClickEvent(self, event):
+    self.zoomed = False
+    self.fit()
 
 
 if __name__ == "__main__":
@@ -187,4 +351,3 @@ if __name__ == "__main__":
   app = DesignSpaceVisualizer(designspace, draw_glyph="e")
   app.show()
   qapp.exec_()
-
@@ -0,0 +1,129 @@
+from fontTools.pens.basePen import BasePen
+from mpl_toolkits.mplot3d import art3d
+from matplotlib.backends.backend_qt5agg import FigureCanvas
+from PyQt5.QtWidgets import QWidget, QVBoxLayout
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+from matplotlib.transforms import Affine2D
+import matplotlib.patches as patches
+
+# (source path, glyph name) -> (digests of the glyph and its components,
+# matplotlib Path of the glyph, ready to be placed). Shared by all the
+# visualizers, as the wizard pages make a new one each time they are shown
+glyph_paths = {}
+
+INSTANCE_COLOR = "#ff7f0e"
+
+class PathPen(BasePen):
+  """Draws a glyph (decomposing its components) into a matplotlib Path."""
+  def __init__(self, glyphSet):
+    super().__init__(glyphSet)
+    self.vertices = []
+    self.codes = []
+
+  def _moveTo(self, pt):
+    self.vertices.append(pt)
+    self.codes.append(Path.MOVETO)
+
+  def _lineTo(self, pt):
+    self.vertices.append(pt)
+    self.codes.append(Path.LINETO)
+
+  def _curveToOne(self, pt1, pt2, pt3):
+    self.vertices.extend([pt1, pt2, pt3])
+    self.codes.extend([Path.CURVE4] * 3)
+
+  def _qCurveToOne(self, pt1, pt2):
+    self.vertices.extend([pt1, pt2])
+    self.codes.extend([Path.CURVE3] * 2)
+
+  def _closePath(self):
+    self.vertices.append(self.vertices[-1])
+    self.codes.append(Path.CLOSEPOLY)
+
+def glyph_to_path(glyphset, glyph):
+  pen = PathPen(glyphset)
+  glyph.draw(pen)
+  if not pen.vertices:
+    return None
+  path = Path(pen.vertices, pen.codes)
+  # Placed near the source's location, as the glyphs always have been
+  extents = path.get_extents()
+  return path.transformed(Affine2D().translate(-extents.width/4, -extents.height/4))
+
+
+class PlotRenderer(QWidget):
+  """Draws designspaces with three or more axes as a matplotlib 3D plot.
+  matplotlib takes a while to import, so this module is only imported
+  when it's needed."""
+  def __init__(self, visualizer):
+    super().__init__(visualizer)
+    self.visualizer = visualizer
+    self.designspace = visualizer.designspace
+    self.layout = QVBoxLayout(self)
+    self.layout.setContentsMargins(0, 0, 0, 0)
+    self.figure = Figure()
+    self.canvas = FigureCanvas(self.figure)
+    self.layout.addWidget(self.canvas)
+    self.ax = self.canvas.figure.add_subplot(111, projection='3d')
+
+  def redraw(self):
+    self.labels_and_limits()
+    if self.visualizer.draw_glyph and len(self.designspace.axes) == 3:
+      self.do_three_axis()
+    self.canvas.draw()
+
+  def move_glyphs(self):
+    # 3D patches are projected when they are made, so can't be moved
+    self.redraw()
+
+  def do_three_axis(self):
+    x_axis, y_axis, z_axis = self.designspace.axes[0:3]
+    z_shift = 1.0/10*(z_axis.maximum-z_axis.minimum)
+
+    for source in self.designspace.sources:
+      loc = source.location
+      if x_axis.name not in loc or y_axis.name not in loc or z_axis.name not in loc:
+        continue
+      xloc = x_axis.map_backward(loc[x_axis.name])
+      yloc = y_axis.map_backward(loc[y_axis.name])
+      zloc = z_axis.map_backward(loc[z_axis.name])
+      self.ax.text(xloc, yloc, zloc+z_shift, self.visualizer.label_text(source), None, wrap=True, size="x-small")
+      path = self.visualizer.glyph_shape(source, glyph_paths, glyph_to_path)
+      if path is not None:
+        at = Affine2D().scale(
+          (x_axis.maximum-x_axis.minimum)/10000,
+          (z_axis.maximum-z_axis.minimum)/10000,
+        ).translate(xloc, zloc)
+        patch = patches.PathPatch(path.transformed(at), fill=True, clip_on=False, linewidth=0)
+        self.ax.add_patch(patch)
+        art3d.pathpatch_2d_to_3d(patch, z=yloc, zdir="y")
+
+    for instance in self.visualizer.instances():
+      loc = instance.location or {}
+      if x_axis.name not in loc or y_axis.name not in loc or z_axis.name not in loc:
+        continue
+      xloc = x_axis.map_backward(loc[x_axis.name])
+      yloc = y_axis.map_backward(loc[y_axis.name])
+      zloc = z_axis.map_backward(loc[z_axis.name])
+      self.ax.text(xloc, yloc, zloc+z_shift, instance.styleName or instance.name or "", None, wrap=True, size="x-small", color=INSTANCE_COLOR)
+      path = self.visualizer.instance_shape(instance, glyph_to_path)
+      if path is not None:
+        at = Affine2D().scale(
+          (x_axis.maximum-x_axis.minimum)/10000,
+          (z_axis.maximum-z_axis.minimum)/10000,
+        ).translate(xloc, zloc)
+        patch = patches.PathPatch(path.transformed(at), fill=True, clip_on=False, linewidth=0, color=INSTANCE_COLOR)
+        self.ax.add_patch(patch)
+        art3d.pathpatch_2d_to_3d(patch, z=yloc, zdir="y")
+
+  def labels_and_limits(self):
+    self.ax.clear()
+    methods = [
+      ("set_xlim", "set_xlabel"),
+      ("set_ylim", "set_ylabel"),
+      ("set_zlim", "set_zlabel")
+    ]
+    for i, axis in enumerate(self.designspace.axes[0:3]):
+      getattr(self.ax,methods[i][0])([axis.minimum, axis.maximum])
+      getattr(self.ax,methods[i][1])(axis.name)
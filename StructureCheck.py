@@ -0,0 +1,405 @@
+"""Finds incompatibilities between masters with NumPy.
+
+Most of the problems which stop a font interpolating are structural: a glyph
+missing from a master, or a different number of paths, nodes in a path or
+types of node. Finding those doesn't need interpolatable.test's statistics
+and contour matching, just a comparison of each glyph's node types with the
+same glyph in the master before it. Each master's glyphs are drawn once into
+flat arrays (paths per glyph, nodes per path, a code for each node type and
+the points), and all the glyphs are compared at once.
+
+The glyphs are drawn the same way interpolatable draws them, so the
+structural problems are reported as it would report them, and the drawings
+are kept so that it doesn't need to read the glifs again for the glyphs which
+pass.
+
+For the glyphs which are structurally compatible, a rough comparison of each
+path's direction, centre and starting point (see approximate_problems) finds
+paths which have clearly been drawn the other way round or from a different
+point. It is only a heuristic: the glyphs whose paths may have changed places,
+or which it can't otherwise be sure about, are left to interpolatable's
+thorough (and slow) matching. This runs on the check's worker processes, so
+it mustn't import Qt."""
+
+import numpy as np
+
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.varLib.interpolatableHelpers import PerContourOrComponentPen
+
+# A path's starting point has clearly moved if it is this far (in radians)
+# round the path's centre from where it was, and clearly hasn't if it is
+# within SAME_START
+MOVED_START = np.pi / 2
+SAME_START = np.pi / 6
+
+# Starting points closer to the centre than this (as a fraction of the size
+# of the path) don't say much about where the path starts
+MIN_START_RADIUS = 0.25
+
+# Paths whose centres move by more than this fraction of the size of the
+# glyph, or which grow or shrink by more than this factor, may have changed
+# places with each other
+MAX_CENTRE_MOVE = 0.5
+MAX_SIZE_CHANGE = 2.0
+
+
+class RecordedGlyph:
+    """A glyph drawn once, which can be drawn again without going back to
+    its glif."""
+
+    def __init__(self, contours):
+        self.contours = contours
+
+    def draw(self, pen, outputImpliedClosingLine=True):
+        for contour in self.contours:
+            contour.replay(pen)
+
+
+class RecordedGlyphSet:
+    """A master's glyphs, with the ones which have been recorded drawn from
+    their recordings."""
+
+    def __init__(self, glyphset, recorded):
+        self.glyphset = glyphset
+        self.recorded = recorded
+
+    def keys(self):
+        return self.glyphset.keys()
+
+    def __contains__(self, name):
+        return name in self.glyphset
+
+    def __getitem__(self, name):
+        if name in self.recorded:
+            return self.recorded[name]
+        return self.glyphset[name]
+
+
+def record(glyph):
+    # As interpolatable.Glyph draws glyphs: one recording for each path or
+    # component
+    pen = PerContourOrComponentPen(RecordingPen)
+    try:
+        glyph.draw(pen, outputImpliedClosingLine=True)
+    except TypeError:
+        glyph.draw(pen)
+    return pen.value
+
+
+class Outlines:
+    """Some glyphs from every master, drawn into flat arrays.
+
+    Glyph-level arrays are indexed by [master, glyph]. Paths from all the
+    masters are numbered together; `first_path` says where a glyph's paths
+    start, and for each path `path_lengths`/`first_node` give its nodes in
+    `nodes` and `point_counts`/`first_point` its points in `x` and `y`."""
+
+    def __init__(self, glyphsets, glyphs):
+        self.glyphs = glyphs
+        masters = len(glyphsets)
+        count = len(glyphs)
+        self.exists = np.zeros((masters, count), bool)
+        self.paths = np.zeros((masters, count), np.int64)
+        self.first_path = np.zeros((masters, count), np.int64)
+        path_lengths = []
+        first_node = []
+        nodes = []
+        point_counts = []
+        first_point = []
+        points = []
+        node_types = {}
+        self.glyphsets = []
+        for m, glyphset in enumerate(glyphsets):
+            drawn = {}
+            for i, name in enumerate(glyphs):
+                glyph = glyphset[name]
+                if glyph is None:
+                    continue
+                contours = record(glyph)
+                drawn[name] = RecordedGlyph(contours)
+                self.exists[m, i] = True
+                self.paths[m, i] = len(contours)
+                self.first_path[m, i] = len(path_lengths)
+                for contour in contours:
+                    first_node.append(len(nodes))
+                    path_lengths.append(len(contour.value))
+                    nodes.extend(
+                        node_types.setdefault(op, len(node_types))
+                        for op, args in contour.value
+                    )
+                    first_point.append(len(points))
+                    ops = contour.value
+                    if ops[0][0] == "moveTo" and ops[-1][0] == "closePath":
+                        for op, args in ops:
+                            points.extend(pt for pt in args if pt is not None)
+                    point_counts.append(len(points) - first_point[-1])
+            self.glyphsets.append(RecordedGlyphSet(glyphset, drawn))
+        self.path_lengths = np.array(path_lengths, np.int64)
+        self.first_node = np.array(first_node, np.int64)
+        self.nodes = np.array(nodes, np.int64)
+        self.type_names = {code: op for op, code in node_types.items()}
+        self.point_counts = np.array(point_counts, np.int64)
+        self.first_point = np.array(first_point, np.int64)
+        points = np.array(points, float).reshape(-1, 2)
+        self.x = points[:, 0]
+        self.y = points[:, 1]
+
+    def checked(self):
+        # Glyphs in only one master aren't checked at all
+        return self.exists.sum(axis=0) >= 2
+
+    def pairs(self):
+        """Yields (master, the master each glyph in it is compared with, and
+        whether there is anything to compare) for each master but the
+        first. Each master is compared with the one before it, or if that
+        hasn't got the glyph, the one before that, and so on."""
+        count = len(self.glyphs)
+        columns = np.arange(count)
+        checked = self.checked()
+        for m1 in range(1, len(self.exists)):
+            m0 = np.full(count, m1 - 1)
+            for k in range(m1 - 1, 0, -1):
+                m0[(m0 == k) & ~self.exists[k]] = k - 1
+            compared = (
+                checked
+                & self.exists[m1]
+                & (self.paths[m1] > 0)
+                & self.exists[m0, columns]
+                & (self.paths[m0, columns] > 0)
+            )
+            yield m1, m0, compared
+
+    def matching_paths(self, m1, m0, glyphs):
+        """Lines up the paths of `glyphs` (which must have the same number
+        of paths in both masters): returns the glyph each pair of paths
+        belongs to, its index within the glyph, and the two paths."""
+        counts = self.paths[m1, glyphs]
+        glyph_of_path = np.repeat(glyphs, counts)
+        index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        path0 = np.repeat(self.first_path[m0[glyphs], glyphs], counts) + index
+        path1 = np.repeat(self.first_path[m1, glyphs], counts) + index
+        return glyph_of_path, index, path0, path1
+
+    def path_shapes(self):
+        """The signed area, centre, size and the angle and distance of the
+        starting point from the centre of every closed path."""
+        counts = self.point_counts
+        shapes = [np.zeros(len(counts)) for _ in range(6)]
+        has_points = counts > 0
+        if not has_points.any():
+            return shapes
+        area, cx, cy, size, angle, radius = shapes
+        starts = self.first_point[has_points]
+        counts = counts[has_points]
+        x, y = self.x, self.y
+        following = np.arange(len(x)) + 1
+        following[starts + counts - 1] = starts
+        cross = x * y[following] - x[following] * y
+        area[has_points] = np.add.reduceat(cross, starts) / 2
+        cx[has_points] = np.add.reduceat(x, starts) / counts
+        cy[has_points] = np.add.reduceat(y, starts) / counts
+        size[:] = np.sqrt(np.abs(area))
+        dx = x[starts] - cx[has_points]
+        dy = y[starts] - cy[has_points]
+        angle[has_points] = np.arctan2(dy, dx)
+        radius[has_points] = np.hypot(dx, dy)
+        return shapes
+
+
+def problem(kind, names, m0, m1, **kwargs):
+    p = {
+        "type": kind,
+        "master_1": names[m0],
+        "master_2": names[m1],
+        "master_1_idx": int(m0),
+        "master_2_idx": int(m1),
+    }
+    p.update(kwargs)
+    return p
+
+
+def group(glyphs, found):
+    """Turns (glyph index, sort key, problem) into a dict of glyph name to
+    problems in order."""
+    problems = {}
+    for i, key, p in sorted(found, key=lambda x: (x[0], x[1])):
+        problems.setdefault(glyphs[i], []).append(p)
+    return problems
+
+
+def structural_problems(outlines, names):
+    """The missing, path_count, node_count and node_incompatibility problems
+    in the outlines, as a dict of glyph name to problems in the form and
+    order interpolatable.test reports them."""
+    found = []
+    for m, i in zip(*np.nonzero(~outlines.exists & outlines.checked())):
+        found.append(
+            (i, (0, m), {"type": "missing", "master": names[m], "master_idx": int(m)})
+        )
+
+    for m1, m0, compared in outlines.pairs():
+        paths0 = outlines.paths[m0, np.arange(len(m0))]
+        differ = compared & (paths0 != outlines.paths[m1])
+        for i in np.nonzero(differ)[0]:
+            p = problem(
+                "path_count",
+                names,
+                m0[i],
+                m1,
+                value_1=int(paths0[i]),
+                value_2=int(outlines.paths[m1, i]),
+            )
+            found.append((i, (1, m1), p))
+
+        same = np.nonzero(compared & ~differ)[0]
+        glyph_of_path, path_index, path0, path1 = outlines.matching_paths(m1, m0, same)
+        length0 = outlines.path_lengths[path0]
+        length1 = outlines.path_lengths[path1]
+        for j in np.nonzero(length0 != length1)[0]:
+            i = glyph_of_path[j]
+            p = problem(
+                "node_count",
+                names,
+                m0[i],
+                m1,
+                path=int(path_index[j]),
+                value_1=int(length0[j]),
+                value_2=int(length1[j]),
+            )
+            found.append((i, (1, m1, int(path_index[j])), p))
+
+        # And then the nodes of the paths with the same number of those
+        alike = np.nonzero(length0 == length1)[0]
+        lengths = length0[alike]
+        pair = np.repeat(alike, lengths)
+        node_index = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        first_node = outlines.first_node
+        types0 = outlines.nodes[
+            np.repeat(first_node[path0[alike]], lengths) + node_index
+        ]
+        types1 = outlines.nodes[
+            np.repeat(first_node[path1[alike]], lengths) + node_index
+        ]
+        for k in np.nonzero(types0 != types1)[0]:
+            j = pair[k]
+            i = glyph_of_path[j]
+            p = problem(
+                "node_incompatibility",
+                names,
+                m0[i],
+                m1,
+                path=int(path_index[j]),
+                node=int(node_index[k]),
+                value_1=outlines.type_names[types0[k]],
+                value_2=outlines.type_names[types1[k]],
+            )
+            found.append((i, (1, m1, int(path_index[j]), int(node_index[k])), p))
+    return group(outlines.glyphs, found)
+
+
+def reordered(glyph_of_path, path0, path1, shapes, cx, cy, size):
+    """The glyphs, of those whose paths are lined up by matching_paths, in
+    which a path is closer (by its centre and size) to another of the
+    glyph's paths in the other master than to its own. Their paths may have
+    changed places: the dots of a dieresis drawn in the other order, say."""
+    if not len(glyph_of_path):
+        return np.zeros(0, np.int64)
+    # matching_paths gives each glyph's paths together
+    starts = np.flatnonzero(np.r_[True, glyph_of_path[1:] != glyph_of_path[:-1]])
+    counts = np.diff(np.r_[starts, len(glyph_of_path)])
+    # Each path in m1 against each of its glyph's paths in m0
+    candidates = np.repeat(counts, counts)
+    first = np.cumsum(candidates) - candidates
+    j = np.repeat(np.arange(len(glyph_of_path)), candidates)
+    k = np.repeat(np.repeat(starts, counts), candidates) + (
+        np.arange(candidates.sum()) - np.repeat(first, candidates)
+    )
+
+    def distance(j, k):
+        d = np.sqrt(
+            (cx[path1[j]] - cx[path0[k]]) ** 2
+            + (cy[path1[j]] - cy[path0[k]]) ** 2
+            + (size[path1[j]] - size[path0[k]]) ** 2
+        )
+        d[~(shapes[j] & shapes[k])] = np.inf
+        return d
+
+    own = np.arange(len(glyph_of_path))
+    nearest = np.minimum.reduceat(distance(j, k), first)
+    return np.unique(glyph_of_path[nearest < distance(own, own)])
+
+
+def approximate_problems(outlines, names, glyphs):
+    """Compares the shapes of the paths of `glyphs` (indexes into the
+    outlines' glyphs, all structurally compatible) between masters.
+
+    Paths which go round the other way, or start from a point clearly
+    somewhere else, are reported as wrong_start_point problems, like the
+    ones interpolatable finds but marked "approximate" and without a
+    proposed starting point. Returns those problems, as a dict of glyph
+    name to problems, and the names of the glyphs which couldn't be
+    judged this way and need interpolatable's contour matching: those whose
+    paths may have changed places (see reordered), moved a long way or
+    changed size a lot, or whose starting point has moved a bit. These
+    problems are not necessarily the ones interpolatable would report."""
+    area, cx, cy, size, angle, radius = outlines.path_shapes()
+    glyphs = np.asarray(glyphs, np.int64)
+    found = []
+    unsure = set()
+    for m1, m0, compared in outlines.pairs():
+        chosen = glyphs[compared[glyphs]]
+        glyph_of_path, path_index, path0, path1 = outlines.matching_paths(
+            m1, m0, chosen
+        )
+        closed = (outlines.point_counts[path0] > 0) & (outlines.point_counts[path1] > 0)
+        # Components, open paths and specks (less than a unit square) tell
+        # us nothing
+        shapes = closed & (size[path0] >= 1) & (size[path1] >= 1)
+
+        # How big each glyph is, going by its biggest path
+        glyph_size = np.zeros(len(outlines.glyphs))
+        np.maximum.at(glyph_size, glyph_of_path, np.maximum(size[path0], size[path1]))
+        moved = np.hypot(cx[path1] - cx[path0], cy[path1] - cy[path0])
+        far = shapes & (
+            (moved > MAX_CENTRE_MOVE * glyph_size[glyph_of_path])
+            | (size[path1] > MAX_SIZE_CHANGE * size[path0])
+            | (size[path0] > MAX_SIZE_CHANGE * size[path1])
+        )
+
+        reversed_ = shapes & ~far & (np.sign(area[path0]) != np.sign(area[path1]))
+        turned = np.abs((angle[path1] - angle[path0] + np.pi) % (2 * np.pi) - np.pi)
+        central = (radius[path0] < MIN_START_RADIUS * size[path0]) | (
+            radius[path1] < MIN_START_RADIUS * size[path1]
+        )
+        started = shapes & ~far & ~reversed_ & ~central & (turned > MOVED_START)
+        between = (
+            shapes
+            & ~far
+            & ~reversed_
+            & (central | ((turned > SAME_START) & (turned <= MOVED_START)))
+        )
+
+        unsure.update(glyph_of_path[far | between].tolist())
+        unsure.update(
+            reordered(glyph_of_path, path0, path1, shapes, cx, cy, size).tolist()
+        )
+        for j in np.nonzero(reversed_ | started)[0]:
+            i = glyph_of_path[j]
+            p = problem(
+                "wrong_start_point",
+                names,
+                m0[i],
+                m1,
+                contour=int(path_index[j]),
+                value_1=0,
+                value_2=None,
+                reversed=bool(reversed_[j]),
+                approximate=True,
+            )
+            found.append((i, (m1, int(path_index[j])), p))
+
+    # interpolatable will look at these again properly
+    found = [x for x in found if x[0] not in unsure]
+    return group(outlines.glyphs, found), [outlines.glyphs[i] for i in sorted(unsure)]
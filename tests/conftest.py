@@ -0,0 +1,103 @@
+import os
+import sys
+
+# The modules live at the top of the repository, as pilcrow.py imports them
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+import ufoLib2
+from fontTools.designspaceLib import (
+    AxisDescriptor,
+    DesignSpaceDocument,
+    InstanceDescriptor,
+    SourceDescriptor,
+)
+
+WEIGHTS = {"Regular": 400, "Bold": 700}
+
+
+def draw_rect(pen, x0, y0, x1, y1):
+    pen.moveTo((x0, y0))
+    pen.lineTo((x0, y1))
+    pen.lineTo((x1, y1))
+    pen.lineTo((x1, y0))
+    pen.closePath()
+
+
+def make_master(path, style, weight):
+    """A small UFO whose "I" and "dieresiscomb" get heavier with `weight`."""
+    ufo = ufoLib2.Font()
+    ufo.info.familyName = "Pilcrow Test"
+    ufo.info.styleName = style
+    ufo.info.unitsPerEm = 1000
+    ufo.info.ascender = 750
+    ufo.info.descender = -250
+    ufo.info.xHeight = 500
+    ufo.info.capHeight = 700
+    stem = weight // 5
+    for name, unicode, width in (
+        (".notdef", None, 500),
+        ("space", 0x20, 250),
+        ("I", 0x49, 200 + stem),
+        ("dieresiscomb", 0x308, 0),
+    ):
+        glyph = ufo.newGlyph(name)
+        glyph.width = width
+        if unicode:
+            glyph.unicodes = [unicode]
+    draw_rect(ufo["I"].getPen(), 100, 0, 100 + stem, 700)
+    pen = ufo["dieresiscomb"].getPen()
+    draw_rect(pen, -200, 750, -200 + stem // 2, 850)
+    draw_rect(pen, 100, 750, 100 + stem // 2, 850)
+    ufo.save(path)
+    return ufo
+
+
+def make_family(directory, styles=WEIGHTS):
+    """Writes masters for `styles` (name -> weight), and a designspace with
+    an instance at each, into `directory`; returns the designspace's path."""
+    doc = DesignSpaceDocument()
+    doc.addAxis(
+        AxisDescriptor(
+            tag="wght",
+            name="Weight",
+            minimum=min(styles.values()),
+            default=min(styles.values()),
+            maximum=max(styles.values()),
+        )
+    )
+    for style, weight in styles.items():
+        filename = "PilcrowTest-%s.ufo" % style
+        make_master(os.path.join(directory, filename), style, weight)
+        doc.addSource(
+            SourceDescriptor(
+                filename=filename,
+                path=os.path.join(directory, filename),
+                location={"Weight": weight},
+                familyName="Pilcrow Test",
+                styleName=style,
+            )
+        )
+        doc.addInstance(
+            InstanceDescriptor(
+                familyName="Pilcrow Test",
+                styleName=style,
+                location={"Weight": weight},
+                filename="instance_ufo/PilcrowTest-%s.ufo" % style,
+            )
+        )
+    path = os.path.join(directory, "PilcrowTest.designspace")
+    doc.write(path)
+    return path
+
+
+@pytest.fixture
+def family(tmp_path):
+    return make_family(str(tmp_path))
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path_factory, monkeypatch):
+    # Tests must neither see nor leave behind anything in the user's caches
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path_factory.mktemp("cache")))
@@ -0,0 +1,16 @@
+from BuildProgress import (
+    KEEP_RUNS,
+    BuildProgress,
+    expected_duration,
+    read_timings,
+)
+
+
+def test_timings_file_is_bounded(family):
+    for run in range(KEEP_RUNS + 5):
+        for args in ({"output": ["variable"]}, {"output": ["ttf"]}):
+            with BuildProgress(family, args, lambda event: None):
+                pass
+    entries = read_timings(family)
+    assert len(entries) == 2 * KEEP_RUNS
+    assert expected_duration(family, {"output": ["ttf"]}) is not None
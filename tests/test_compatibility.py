@@ -0,0 +1,45 @@
+import os
+
+from conftest import draw_rect, make_master
+from CompatibilityCheck import check
+from fontTools.designspaceLib import DesignSpaceDocument
+
+
+def add_adieresis(ufo, weight, swap_dots=False):
+    # The dots are close enough together, next to the bowl, that swapping
+    # them doesn't move either path far
+    glyph = ufo.newGlyph("Adieresis")
+    glyph.width = 600
+    pen = glyph.getPen()
+    draw_rect(pen, 50, 0, 550, 700)
+    dot = weight // 10
+    dots = [(200, 750, 200 + dot, 850), (340, 750, 340 + dot, 850)]
+    if swap_dots:
+        dots.reverse()
+    for dot in dots:
+        draw_rect(pen, *dot)
+
+
+def masters(directory, swap_dots):
+    paths = []
+    for style, weight, swap in (("Regular", 400, False), ("Bold", 700, swap_dots)):
+        path = os.path.join(directory, "PilcrowTest-%s.ufo" % style)
+        ufo = make_master(path, style, weight)
+        add_adieresis(ufo, weight, swap)
+        ufo.save(path, overwrite=True)
+        paths.append(path)
+    return paths
+
+
+def test_swapped_contours(tmp_path):
+    paths = masters(str(tmp_path), swap_dots=True)
+    problems = check(paths, ["Regular", "Bold"], jobs=1, use_cache=False)
+    assert [p["type"] for p in problems["Adieresis"]] == ["contour_order"]
+    assert problems["Adieresis"][0]["value_2"] == [0, 2, 1]
+
+
+def test_compatible(family):
+    designspace = DesignSpaceDocument.fromfile(family)
+    paths = [source.path for source in designspace.sources]
+    problems = check(paths, ["Regular", "Bold"], jobs=1, use_cache=False)
+    assert problems == {}
@@ -0,0 +1,40 @@
+import os
+from types import SimpleNamespace
+
+from conftest import make_master
+from GlyphReader import glyph_reader
+from QDesignSpace import DesignSpaceVisualizer
+
+
+def test_composite_shape_follows_its_components(tmp_path):
+    ufo_path = str(tmp_path / "Test.ufo")
+    ufo = make_master(ufo_path, "Regular", 400)
+    composite = ufo.newGlyph("Idieresis")
+    composite.width = ufo["I"].width
+    pen = composite.getPen()
+    pen.addComponent("I", (1, 0, 0, 1, 0, 0))
+    pen.addComponent("dieresiscomb", (1, 0, 0, 1, 140, 0))
+    ufo.save(ufo_path, overwrite=True)
+
+    drawn = []
+
+    def convert(glyphset, glyph):
+        drawn.append(glyph.name)
+        return len(drawn)
+
+    cache = {}
+    source = SimpleNamespace(path=ufo_path)
+    visualizer = SimpleNamespace(
+        glyphsets={ufo_path: glyph_reader(ufo_path)}, draw_glyph="Idieresis"
+    )
+    assert DesignSpaceVisualizer.glyph_shape(visualizer, source, cache, convert) == 1
+    assert DesignSpaceVisualizer.glyph_shape(visualizer, source, cache, convert) == 1
+
+    # Only a component changes; the composite's glif is as it was
+    with open(os.path.join(ufo_path, "glyphs", "dieresiscomb.glif"), "w") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<glyph name="dieresiscomb" format="2"><advance width="0"/></glyph>\n'
+        )
+    visualizer.glyphsets = {ufo_path: glyph_reader(ufo_path)}
+    assert DesignSpaceVisualizer.glyph_shape(visualizer, source, cache, convert) == 2
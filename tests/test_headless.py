@@ -0,0 +1,36 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def pilcrow(*args):
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "pilcrow.py")] + list(args),
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+
+def test_build_json_report(family):
+    # The second run finds the font up to date, which is logged by the worker
+    for expected in ("built", "up to date"):
+        result = pilcrow("build", family, "--variable", "--format", "json", "-j", "1")
+        assert result.returncode == 0, result.stderr
+        report = json.loads(result.stdout)
+        assert report[family]["status"] == "ok"
+        assert [t["status"] for t in report[family]["tasks"]] == [expected]
+
+
+def test_build_json_report_failure(family, tmp_path):
+    shutil.rmtree(os.path.join(str(tmp_path), "PilcrowTest-Bold.ufo"))
+    result = pilcrow("build", family, "--variable", "--format", "json", "-j", "1")
+    assert result.returncode == 1
+    report = json.loads(result.stdout)
+    assert report[family]["status"] == "failed"
+    assert report[family]["tasks"][0]["status"] == "failed"
+    assert report[family]["tasks"][0]["message"] in result.stderr
@@ -0,0 +1,51 @@
+import os
+
+from conftest import make_family
+from fontTools.designspaceLib import DesignSpaceDocument
+from fontTools.ttLib import TTFont
+
+from BuildTasks import BuildOptions, run_fontmake, variable_font_path
+from Instancer import run_instancer, static_fonts
+
+NAME_IDS = (1, 2, 3, 4, 6, 16, 17)
+
+
+def style_fields(font):
+    return {
+        "fsSelection": font["OS/2"].fsSelection & (1 << 0 | 1 << 5 | 1 << 6),
+        "macStyle": font["head"].macStyle,
+        "usWeightClass": font["OS/2"].usWeightClass,
+        "STAT": "STAT" in font,
+        "names": {i: font["name"].getDebugName(i) for i in NAME_IDS},
+    }
+
+
+def test_instances_match_fontmake(tmp_path):
+    directory = str(tmp_path)
+    designspace_file = make_family(
+        directory, {"Regular": 400, "Medium": 500, "Bold": 700}
+    )
+    fontmake_dir = os.path.join(directory, "fontmake")
+    assert run_fontmake(
+        designspace_file,
+        {"output": ["ttf"], "interpolate": True, "output_dir": fontmake_dir},
+    ) == (0, "")
+    assert run_fontmake(
+        designspace_file,
+        {"output": ["variable"], "output_path": variable_font_path(designspace_file)},
+    ) == (0, "")
+
+    designspace = DesignSpaceDocument.fromfile(designspace_file)
+    fonts = static_fonts(
+        designspace_file,
+        designspace,
+        BuildOptions(output_instances=True),
+        os.path.join(directory, "instancer"),
+    )
+    assert len(fonts) == 3
+    for label, location, names, output_file in fonts:
+        assert run_instancer(
+            variable_font_path(designspace_file), location, names, output_file
+        ) == (0, "")
+        expected = TTFont(os.path.join(fontmake_dir, os.path.basename(output_file)))
+        assert style_fields(TTFont(output_file)) == style_fields(expected)
@@ -0,0 +1,35 @@
+import os
+
+from conftest import make_master
+from Cache import cache_dir, key_for
+from OutlineCache import OutlineCache
+
+
+def test_unreadable_cache_with_deleted_glyph(tmp_path):
+    ufo_path = str(tmp_path / "Test.ufo")
+    ufo = make_master(ufo_path, "Regular", 400)
+    cache = OutlineCache(ufo_path)
+    os.remove(cache.data_path(cache.index))
+
+    del ufo["dieresiscomb"]
+    ufo.save(ufo_path, overwrite=True)
+    cache = OutlineCache(ufo_path)
+    assert sorted(cache.keys()) == [".notdef", "I", "space"]
+    assert len(cache["I"].contours) == 1
+
+
+def test_update_removes_only_the_replaced_file(tmp_path):
+    ufo_path = str(tmp_path / "Test.ufo")
+    ufo = make_master(ufo_path, "Regular", 400)
+    replaced = OutlineCache(ufo_path)
+    # Written by another process's update, say
+    newer = os.path.join(cache_dir("outlines"), key_for(ufo_path) + "-1-2.bin")
+    with open(newer, "wb") as f:
+        f.write(b"")
+
+    ufo["I"].width = 300
+    ufo.save(ufo_path, overwrite=True)
+    cache = OutlineCache(ufo_path)
+    assert cache["I"].width == 300
+    assert not os.path.exists(replaced.data_path(replaced.index))
+    assert os.path.exists(newer)
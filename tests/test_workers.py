@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+from conftest import ROOT
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+
+# The GUI is started as `python3 pilcrow.py`, and spawned workers import
+# the main module again (as __mp_main__) before running anything
+PROBE = textwrap.dedent(
+    """
+    import sys
+    sys.path[:0] = [%r, %r]
+    import __main__
+    __main__.__file__ = %r
+
+    from concurrent.futures import ProcessPoolExecutor
+    from BuildTasks import Worker, mp_context
+    from worker_probe import build_job, gui_modules
+
+    worker = Worker()
+    worker.submit("probe", "probe", build_job, ())
+    while not worker.receive():
+        worker.conn.poll(10)
+    worker.stop()
+    print("build:" + worker.result[1])
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as pool:
+        print("check:" + ",".join(pool.submit(gui_modules).result()))
+    """
+)
+
+
+def test_workers_dont_import_the_gui():
+    script = PROBE % (ROOT, TESTS, os.path.join(ROOT, "pilcrow.py"))
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        env=dict(os.environ, QT_QPA_PLATFORM="offscreen"),
+    )
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.split()
+    assert "build:" in lines
+    assert "check:" in lines
+
+
+def test_pool_shrinks_after_a_big_build():
+    from BuildTasks import run_pool, workers
+    from worker_probe import build_job
+
+    size = workers.size
+    workers.size = 2
+    try:
+        tasks = {i: ("Job %i" % i, build_job, ()) for i in range(4)}
+        results = list(run_pool(tasks, 4))
+        assert len(results) == 4
+        assert len(workers.idle) == 2
+        assert workers.running_jobs == 0
+    finally:
+        workers.size = size
+        workers.shutdown()
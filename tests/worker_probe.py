@@ -0,0 +1,15 @@
+"""Functions for the worker tests to run on worker processes."""
+
+import sys
+
+GUI_MODULES = ("PyQt5", "qt_material", "matplotlib")
+
+
+def gui_modules():
+    """The GUI toolkits imported in this process."""
+    return [module for module in GUI_MODULES if module in sys.modules]
+
+
+def build_job(progress=None, label=""):
+    """A job for a warm build worker (see BuildTasks.worker_main)."""
+    return 0, ",".join(gui_modules())